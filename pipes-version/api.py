@@ -1,14 +1,21 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
+from pydantic import BaseModel, ValidationError
 from contextlib import asynccontextmanager
+import asyncio
+import secrets
 import uvicorn
 
-from main import Pipeline
+from main import Pipeline, PipelineOverloaded, PipelineUnavailable
+from utils import ADMIN_TOKEN, INGEST_BATCH_SIZE
 
 class Message(BaseModel):
     text: str
     user_alias: str
 
+class BadWordsUpdate(BaseModel):
+    bad_words: list[str]
+
 class HealthResponse(BaseModel):
     status: str = "healthy"
 
@@ -34,29 +41,135 @@ app = FastAPI(lifespan=lifespan)
 async def health_check():
     return HealthResponse()
 
+@app.get("/stats")
+async def stats():
+    return app.state.pipeline.stats_snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(
+        app.state.pipeline.render_metrics(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.put("/admin/bad-words")
+async def update_bad_words(update: BadWordsUpdate, x_admin_token: str | None = Header(default=None)):
+    if ADMIN_TOKEN and not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    await app.state.pipeline.update_bad_words(update.bad_words)
+    return {"status": "updated", "bad_words": len(update.bad_words)}
+
 @app.post("/message", response_model=MessageResponse)
 async def process_message(message: Message):
     try:
-        result = app.state.pipeline.process_message(message.text)
-        
-        if not result:
-            return MessageResponse(
-                status="filtered",
-                processed_text=None,
-                error="Message contained stop words"
-            )
+        result = await app.state.pipeline.process_message(message.text)
+        return _message_response(result)
         
-        return MessageResponse(
-            status="success",
-            processed_text=result
+    except PipelineOverloaded as e:
+        raise _overloaded(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
         )
+
+@app.post("/messages", response_model=list[MessageResponse])
+async def process_messages(messages: list[Message]):
+    try:
+        results = await app.state.pipeline.process_messages([message.text for message in messages])
+        return [_message_response(result) for result in results]
         
+    except PipelineOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=str(e)
         )
 
+@app.post("/messages/stream")
+async def stream_messages(request: Request):
+    slots = asyncio.Semaphore(max(1, app.state.pipeline.max_in_flight // INGEST_BATCH_SIZE))
+    batches = []
+    
+    async def process(batch: list[Message | MessageResponse]) -> list[MessageResponse]:
+        try:
+            return await _process_batch(batch)
+        finally:
+            slots.release()
+    
+    async for batch in _ndjson_batches(request):
+        await slots.acquire()
+        batches.append(asyncio.create_task(process(batch)))
+    
+    responses = [response for batch in await asyncio.gather(*batches) for response in batch]
+    return Response(
+        "".join(response.model_dump_json() + "\n" for response in responses),
+        media_type="application/x-ndjson"
+    )
+
+async def _ndjson_batches(request: Request):
+    batch = []
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                batch.append(_parse_line(line))
+            if len(batch) >= INGEST_BATCH_SIZE:
+                yield batch
+                batch = []
+    if buffer.strip():
+        batch.append(_parse_line(buffer))
+    if batch:
+        yield batch
+
+def _parse_line(line: bytes) -> Message | MessageResponse:
+    try:
+        return Message.model_validate_json(line)
+    except ValidationError as e:
+        return MessageResponse(status="error", error=str(e))
+
+async def _process_batch(batch: list[Message | MessageResponse]) -> list[MessageResponse]:
+    messages = [item for item in batch if isinstance(item, Message)]
+    try:
+        results = iter(await app.state.pipeline.process_messages([message.text for message in messages]))
+    except PipelineOverloaded as e:
+        results = iter([MessageResponse(status="rejected", error=str(e))] * len(messages))
+    except Exception as e:
+        results = iter([MessageResponse(status="error", error=str(e))] * len(messages))
+    return [
+        _message_response(next(results)) if isinstance(item, Message) else item
+        for item in batch
+    ]
+
+def _overloaded(error: PipelineOverloaded) -> HTTPException:
+    return HTTPException(
+        status_code=503 if isinstance(error, PipelineUnavailable) else 429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def _message_response(result: str | MessageResponse | None) -> MessageResponse:
+    if isinstance(result, MessageResponse):
+        return result
+    if result is None:
+        return MessageResponse(
+            status="rejected",
+            error="Pipeline is at capacity"
+        )
+    if not result:
+        return MessageResponse(
+            status="filtered",
+            processed_text=None,
+            error="Message contained stop words"
+        )
+    return MessageResponse(
+        status="success",
+        processed_text=result
+    )
+
 def run_server():
     uvicorn.run(
         "api:app",
@@ -0,0 +1,45 @@
+from collections import OrderedDict
+
+ENTRY_OVERHEAD = 200
+
+class ResultCache:
+    def __init__(self, max_bytes: int, max_text_length: int):
+        self.max_bytes = max_bytes
+        self.max_text_length = max_text_length
+        self.entries: OrderedDict[str, str] = OrderedDict()
+        self.size = 0
+        self.generation = 0
+
+    def get(self, text: str) -> str | None:
+        result = self.entries.get(text)
+        if result is not None:
+            self.entries.move_to_end(text)
+        return result
+
+    def put(self, text: str, result: str, generation: int):
+        if generation != self.generation or len(text) > self.max_text_length:
+            return
+        cost = _cost(text, result)
+        if cost > self.max_bytes:
+            return
+
+        previous = self.entries.pop(text, None)
+        if previous is not None:
+            self.size -= _cost(text, previous)
+        self.entries[text] = result
+        self.size += cost
+
+        while self.size > self.max_bytes:
+            evicted_text, evicted_result = self.entries.popitem(last=False)
+            self.size -= _cost(evicted_text, evicted_result)
+
+    def invalidate(self):
+        self.entries.clear()
+        self.size = 0
+        self.generation += 1
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+def _cost(text: str, result: str) -> int:
+    return len(text) + len(result) + ENTRY_OVERHEAD
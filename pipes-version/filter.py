@@ -1,33 +1,296 @@
 from dataclasses import dataclass
 from datetime import datetime
 from abc import ABC, abstractmethod
-from multiprocessing import Process, Queue
+from multiprocessing import Process, Queue, Value
+import queue
+import signal
+import threading
+import time
+
+from metrics import MetricsRegistry, StageMetrics
+from stats import LatencyHistogram
 
 @dataclass
 class Message:
+    id: int
     content: str
     created_at: datetime
 
+@dataclass
+class MessageBatch:
+    messages: list[Message]
+
+def message_count(item: Message | MessageBatch | None) -> int:
+    if item is None:
+        return 0
+    return len(item.messages) if isinstance(item, MessageBatch) else 1
+
+class CountingQueue:
+    def __init__(self, channel):
+        self.channel = channel
+        self.count = Value('q', 0)
+
+    def put(self, item: Message | MessageBatch | None, block: bool = True, timeout: float | None = None):
+        self.channel.put(item, block, timeout)
+        self._add(message_count(item))
+
+    def put_nowait(self, item: Message | MessageBatch | None):
+        self.put(item, block=False)
+
+    def get(self, block: bool = True, timeout: float | None = None) -> Message | MessageBatch | None:
+        item = self.channel.get(block, timeout)
+        self._add(-message_count(item))
+        return item
+
+    def get_nowait(self) -> Message | MessageBatch | None:
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        return self.channel.qsize()
+
+    def messages(self) -> int:
+        return max(0, self.count.value)
+
+    def _add(self, count: int):
+        if count:
+            with self.count.get_lock():
+                self.count.value += count
+
 class Filter(Process, ABC):
-    def __init__(self, outputs: list[Queue]):
+    concurrency = 1
+    cheap = False
+    commutative = False
+    rejects = False
+
+    def __init__(self, outputs: list[Queue], input_queue: Queue = None):
         super().__init__()
-        self.input = Queue()
+        self.input = input_queue if input_queue is not None else Queue()
         self.outputs = outputs
+        self.metrics = None
+        self.latency = None
+        self.batch_size = 1
+        self.batch_wait = 0.0
+        self.emit_batches = True
 
     @abstractmethod
     def _process(self, content: str) -> str:
         raise NotImplementedError
 
+    def _process_batch(self, contents: list[str]) -> list[str]:
+        return [self._process(content) for content in contents]
+
+    def _setup(self) -> None:
+        pass
+
+    def _teardown(self) -> None:
+        pass
+
     def run(self) -> None:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self._work()
+
+    def _work(self) -> None:
+        self._setup()
+
+        try:
+            while True:
+                messages, stop = self._next_batch()
+                if messages:
+                    if self.metrics is not None or self.latency is not None:
+                        now = datetime.now()
+                        lags = [(now - data.created_at).total_seconds() for data in messages]
+                        if self.metrics is not None:
+                            self.metrics.lag.observe_many(lags)
+                        if self.latency is not None:
+                            self.latency.record_many(lags)
+
+                    self._handle_batch(messages)
+                if stop:
+                    break
+        finally:
+            self._teardown()
+
+    def _next_batch(self) -> tuple[list[Message], bool]:
+        messages = []
+        item = self.input.get()
+        deadline = None
+
         while True:
-            data = self.input.get()
-            lag = (datetime.now() - data.created_at).total_seconds() * 1000
-            print(self.__class__.__name__, f'{lag}ms')
-            
-            processed_content = self._process(data.content)
-            
-            for output in self.outputs:
-                output.put(Message(
-                    content=processed_content,
-                    created_at=data.created_at
-                )) 
\ No newline at end of file
+            if item is None:
+                return messages, True
+            if isinstance(item, MessageBatch):
+                messages.extend(item.messages)
+            else:
+                messages.append(item)
+            if len(messages) >= self.batch_size:
+                return messages, False
+
+            try:
+                item = self.input.get_nowait()
+            except queue.Empty:
+                if deadline is None:
+                    deadline = time.monotonic() + self.batch_wait
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return messages, False
+                try:
+                    item = self.input.get(timeout=remaining)
+                except queue.Empty:
+                    return messages, False
+
+    def _handle_batch(self, messages: list[Message]) -> None:
+        start_time = time.perf_counter()
+        contents = self._process_batch([data.content for data in messages])
+        self._record_processed(time.perf_counter() - start_time, len(messages))
+
+        if len(messages) == 1 or not self.emit_batches:
+            for data, content in zip(messages, contents):
+                self._emit(data, content)
+            return
+
+        batch = MessageBatch([
+            Message(id=data.id, content=content, created_at=data.created_at)
+            for data, content in zip(messages, contents)
+        ])
+        for output in self.outputs:
+            output.put(batch)
+
+    def _emit(self, data: Message, content: str) -> None:
+        for output in self.outputs:
+            output.put(Message(
+                id=data.id,
+                content=content,
+                created_at=data.created_at
+            ))
+
+    def _record_processed(self, seconds: float, count: int = 1):
+        if self.metrics is None:
+            return
+        self.metrics.service_time.observe(seconds / count, count)
+        self.metrics.messages.inc(count)
+
+class FilterThread(threading.Thread):
+    def __init__(self, worker: Filter):
+        super().__init__(target=worker._work, name=type(worker).__name__, daemon=True)
+        self.worker = worker
+
+    @property
+    def concurrency(self) -> int:
+        return self.worker.concurrency
+
+    def terminate(self):
+        pass
+
+ENGINES = ('process', 'thread')
+
+class FilterPool:
+    def __init__(self, filter_cls: type[Filter], outputs: list[Queue],
+                 min_workers: int = 1, max_workers: int = 1, input_queue: Queue = None,
+                 batch_size: int = 1, batch_wait_ms: float = 0.0, emit_batches: bool = True,
+                 registry: MetricsRegistry = None, stats_window: int = 60, engine: str = 'process',
+                 name: str | None = None, **filter_kwargs):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown stage engine: {engine}")
+        self.filter_cls = filter_cls
+        self.name = name or filter_cls.__name__
+        self.engine = engine
+        self.filter_kwargs = filter_kwargs
+        self.outputs = outputs
+        if input_queue is None:
+            input_queue = CountingQueue(queue.Queue() if engine == 'thread' else Queue())
+        self.input = input_queue
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait_ms / 1000
+        self.emit_batches = emit_batches
+        self.metrics = StageMetrics(registry if registry is not None else MetricsRegistry(), self.name)
+        self.latency = LatencyHistogram(stats_window)
+        self.workers: list[Filter | FilterThread] = []
+        self.stopping = 0
+        self.lock = threading.RLock()
+        self.last_sample = (0.0, 0.0)
+        self.last_service_time = 0.0
+
+    @property
+    def concurrency(self) -> int:
+        return self.workers[0].concurrency if self.workers else 1
+
+    @property
+    def size(self) -> int:
+        return len(self.workers) - self.stopping
+
+    def start(self):
+        self.resize(self.min_workers)
+
+    def resize(self, target: int) -> int:
+        with self.lock:
+            return self._resize(target)
+
+    def restart(self, **filter_kwargs):
+        with self.lock:
+            size = max(self.min_workers, self.size)
+            self.shutdown()
+            self.filter_kwargs.update(filter_kwargs)
+            self._resize(size)
+
+    def _reap(self):
+        alive = [w for w in self.workers if w.is_alive()]
+        self.stopping = max(0, self.stopping - (len(self.workers) - len(alive)))
+        self.workers = alive
+
+    def _resize(self, target: int) -> int:
+        self._reap()
+        target = max(self.min_workers, min(self.max_workers, target))
+        while self.size < target:
+            worker = self.filter_cls(
+                outputs=self.outputs,
+                input_queue=self.input,
+                **self.filter_kwargs
+            )
+            worker.metrics = self.metrics
+            worker.latency = self.latency
+            worker.batch_size = self.batch_size
+            worker.batch_wait = self.batch_wait
+            worker.emit_batches = self.emit_batches
+            if self.engine == 'thread':
+                worker = FilterThread(worker)
+            worker.start()
+            self.workers.append(worker)
+        while self.size > target:
+            self.input.put(None)
+            self.stopping += 1
+
+        self.metrics.workers.set(self.size)
+        return self.size
+
+    def depth(self) -> int | None:
+        if isinstance(self.input, CountingQueue):
+            return self.input.messages()
+        try:
+            return self.input.qsize()
+        except NotImplementedError:
+            return None
+
+    def sample_service_time(self) -> float:
+        total, count = self.metrics.service_time.sum, self.metrics.service_time.count
+        last_total, last_count = self.last_sample
+        self.last_sample = (total, count)
+
+        if count > last_count:
+            self.last_service_time = (total - last_total) / (count - last_count)
+        return self.last_service_time
+
+    def shutdown(self, timeout: float = 5.0):
+        with self.lock:
+            self._reap()
+            for _ in range(self.size):
+                self.input.put(None)
+
+            for worker in self.workers:
+                worker.join(timeout=timeout)
+                if worker.is_alive():
+                    worker.terminate()
+            self.workers.clear()
+            self.stopping = 0
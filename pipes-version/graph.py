@@ -0,0 +1,250 @@
+from dataclasses import dataclass, field, replace
+from multiprocessing import Queue
+
+from filter import Filter, ENGINES
+from utils import PIPELINE_QUEUE_SIZE
+
+SOURCE = 'source'
+SINK = 'sink'
+
+class FusedFilter(Filter):
+    cheap = True
+
+    def __init__(self, outputs: list, stages: list[tuple[type[Filter], dict]], input_queue: Queue = None):
+        super().__init__(outputs, input_queue)
+        self.stages = [filter_cls(outputs=[], input_queue=self.input, **kwargs) for filter_cls, kwargs in stages]
+        self.concurrency = max(stage.concurrency for stage in self.stages)
+
+    def _setup(self):
+        for stage in self.stages:
+            stage._setup()
+
+    def _teardown(self):
+        for stage in reversed(self.stages):
+            stage._teardown()
+
+    def _process(self, content: str) -> str:
+        for stage in self.stages:
+            if not content:
+                break
+            content = stage._process(content)
+        return content
+
+    def _process_batch(self, contents: list[str]) -> list[str]:
+        results = list(contents)
+        live = [index for index, content in enumerate(results) if content]
+        for stage in self.stages:
+            if not live:
+                break
+            for index, content in zip(live, stage._process_batch([results[index] for index in live])):
+                results[index] = content
+            live = [index for index in live if results[index]]
+        return results
+
+@dataclass
+class Stage:
+    name: str
+    filter_cls: type[Filter]
+    kwargs: dict = field(default_factory=dict)
+    workers: tuple[int, int] = (1, 1)
+    engine: str = 'process'
+    batch_size: int = 1
+    batch_wait_ms: float = 0.0
+    emit_batches: bool = True
+    members: list['Stage'] = field(default_factory=list)
+
+    @property
+    def label(self) -> str:
+        if self.members:
+            return '+'.join(member.filter_cls.__name__ for member in self.members)
+        return self.filter_cls.__name__
+
+    def filter_kwargs(self) -> dict:
+        if self.members:
+            return {'stages': [(member.filter_cls, member.kwargs) for member in self.members]}
+        return self.kwargs
+
+    def find(self, filter_cls: type[Filter]) -> list['Stage']:
+        return [stage for stage in (self.members or [self]) if issubclass(stage.filter_cls, filter_cls)]
+
+@dataclass
+class Edge:
+    source: str
+    target: str
+    maxsize: int
+
+class PipelineGraph:
+    def __init__(self, queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.stages: dict[str, Stage] = {}
+        self.edges: list[Edge] = []
+        self.resume_stage: str | None = None
+
+    def stage(self, name: str, filter_cls: type[Filter], workers: tuple[int, int] = (1, 1),
+              engine: str = 'process', batch_size: int = 1, batch_wait_ms: float = 0.0,
+              emit_batches: bool = True, **kwargs) -> 'PipelineGraph':
+        if name in self.stages or name in (SOURCE, SINK):
+            raise ValueError(f"Duplicate stage name: {name}")
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown stage engine: {engine}")
+        self.stages[name] = Stage(name, filter_cls, kwargs, tuple(workers), engine,
+                                  batch_size, batch_wait_ms, emit_batches)
+        return self
+
+    def edge(self, source: str, target: str, maxsize: int | None = None) -> 'PipelineGraph':
+        for edge in self.edges:
+            if edge.source == source and edge.target == target:
+                edge.maxsize = maxsize or self.queue_size
+                return self
+        self.edges.append(Edge(source, target, maxsize or self.queue_size))
+        return self
+
+    def chain(self, *names: str, maxsize: int | None = None) -> 'PipelineGraph':
+        for source, target in zip(names, names[1:]):
+            self.edge(source, target, maxsize)
+        return self
+
+    def resume(self, name: str) -> 'PipelineGraph':
+        self.resume_stage = name
+        return self
+
+    def targets(self, name: str) -> list[str]:
+        return [edge.target for edge in self.edges if edge.source == name]
+
+    def sources(self, name: str) -> list[str]:
+        return [edge.source for edge in self.edges if edge.target == name]
+
+    def capacity(self, name: str) -> int:
+        return sum(edge.maxsize for edge in self.edges if edge.target == name)
+
+    def validate(self) -> 'PipelineGraph':
+        nodes = {SOURCE, SINK, *self.stages}
+        for edge in self.edges:
+            if edge.source not in nodes or edge.target not in nodes:
+                raise ValueError(f"Edge {edge.source} -> {edge.target} references an unknown stage")
+            if edge.source == SINK or edge.target == SOURCE:
+                raise ValueError(f"Edge {edge.source} -> {edge.target} points the wrong way")
+        if len(self.targets(SOURCE)) != 1:
+            raise ValueError("The source must feed exactly one stage")
+        if self.resume_stage is not None and self.resume_stage not in self.stages:
+            raise ValueError(f"Unknown resume stage: {self.resume_stage}")
+
+        order = self.topological_order()
+        reachable = {SOURCE}
+        for name in [SOURCE, *order]:
+            if name in reachable:
+                reachable.update(self.targets(name))
+        unreachable = [name for name in self.stages if name not in reachable]
+        if unreachable:
+            raise ValueError(f"Stages not reachable from the source: {', '.join(unreachable)}")
+        if SINK not in reachable:
+            raise ValueError("No path from the source reaches the sink")
+        return self
+
+    def topological_order(self) -> list[str]:
+        indegree = {name: 0 for name in self.stages}
+        for edge in self.edges:
+            if edge.source in indegree and edge.target in indegree:
+                indegree[edge.target] += 1
+        ready = [name for name in self.stages if indegree[name] == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for target in self.targets(name):
+                if target in indegree:
+                    indegree[target] -= 1
+                    if indegree[target] == 0:
+                        ready.append(target)
+        if len(order) != len(self.stages):
+            raise ValueError("Pipeline graph has a cycle")
+        return order
+
+    def optimize(self, reorder: bool = True, fuse: bool = True) -> 'PipelineGraph':
+        graph = self.copy().validate()
+        if reorder:
+            graph._reorder()
+        if fuse:
+            graph._fuse()
+        return graph.validate()
+
+    def copy(self) -> 'PipelineGraph':
+        graph = PipelineGraph(self.queue_size)
+        graph.stages = {name: replace(stage, kwargs=dict(stage.kwargs)) for name, stage in self.stages.items()}
+        graph.edges = [replace(edge) for edge in self.edges]
+        graph.resume_stage = self.resume_stage
+        return graph
+
+    def _linked(self, source: str, target: str, fits) -> bool:
+        if source not in self.stages or target not in self.stages or self.resume_stage in (source, target):
+            return False
+        return (self.targets(source) == [target] and self.sources(target) == [source]
+                and fits(self.stages[source]) and fits(self.stages[target]))
+
+    def _chains(self, fits) -> list[list[str]]:
+        chains = []
+        for name in self.topological_order():
+            if any(self._linked(source, name, fits) for source in self.sources(name)):
+                continue
+            chain = [name]
+            while len(self.targets(chain[-1])) == 1 and self._linked(chain[-1], self.targets(chain[-1])[0], fits):
+                chain.append(self.targets(chain[-1])[0])
+            if len(chain) > 1:
+                chains.append(chain)
+        return chains
+
+    def _reorder(self):
+        for chain in self._chains(lambda stage: stage.filter_cls.commutative):
+            order = sorted(chain, key=lambda name: not self.stages[name].filter_cls.rejects)
+            emit_batches = [self.stages[name].emit_batches for name in chain]
+            for name, emits in zip(order, emit_batches):
+                self.stages[name].emit_batches = emits
+            rename = dict(zip(chain, order))
+            for edge in self.edges:
+                edge.source = rename.get(edge.source, edge.source)
+                edge.target = rename.get(edge.target, edge.target)
+
+    def _fuse(self):
+        engines = {stage.engine for stage in self.stages.values()}
+        for engine in engines:
+            fits = lambda stage: stage.filter_cls.cheap and stage.engine == engine
+            for chain in self._chains(fits):
+                self._merge(chain)
+
+    def _merge(self, chain: list[str]):
+        stages = [self.stages.pop(name) for name in chain]
+        members = [member for stage in stages for member in (stage.members or [stage])]
+        fused = Stage(
+            name='+'.join(chain),
+            filter_cls=FusedFilter,
+            workers=(max(stage.workers[0] for stage in stages), max(stage.workers[1] for stage in stages)),
+            engine=stages[0].engine,
+            batch_size=stages[0].batch_size,
+            batch_wait_ms=stages[0].batch_wait_ms,
+            emit_batches=stages[-1].emit_batches,
+            members=members
+        )
+        fused.kwargs = fused.filter_kwargs()
+        self.stages[fused.name] = fused
+
+        inner = set(chain)
+        self.edges = [edge for edge in self.edges if not (edge.source in inner and edge.target in inner)]
+        for edge in self.edges:
+            if edge.source in inner:
+                edge.source = fused.name
+            if edge.target in inner:
+                edge.target = fused.name
+
+    @classmethod
+    def from_dict(cls, config: dict, filters: dict[str, type[Filter]]) -> 'PipelineGraph':
+        graph = cls(config.get('queue_size', PIPELINE_QUEUE_SIZE))
+        for name, stage in config.get('stages', {}).items():
+            options = {key: value for key, value in stage.items() if key not in ('filter', 'kwargs')}
+            if stage.get('filter') not in filters:
+                raise ValueError(f"Unknown filter for stage {name}: {stage.get('filter')}")
+            graph.stage(name, filters[stage['filter']], **options, **stage.get('kwargs', {}))
+        for edge in config.get('edges', []):
+            graph.edge(edge['source'], edge['target'], edge.get('maxsize'))
+        if config.get('resume'):
+            graph.resume(config['resume'])
+        return graph.validate()
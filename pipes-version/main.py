@@ -1,81 +1,401 @@
 from multiprocessing import Queue, Event
+from threading import Thread
 from datetime import datetime
+from functools import partial
+import itertools
+import json
+import math
+import queue
+import asyncio
 import signal
 import sys
 import time
 
-from filter import Message
+from filter import Filter, Message, MessageBatch, FilterPool, CountingQueue
+from graph import PipelineGraph, SOURCE, SINK
+from metrics import MetricsRegistry
+from cache import ResultCache
+from ring import RingQueue
 from processing import ScreamingFilter, ProfanityFilter, EmailFilter
-from utils import BAD_WORDS, PipelineStats, EMAIL_SENDER, EMAIL_PASSWORD, EMAIL_RECIPIENTS
+from utils import (
+    BAD_WORDS, PipelineStats, EMAIL_SENDER, EMAIL_PASSWORD, EMAIL_RECIPIENTS,
+    EMAIL_SMTP_POOL_SIZE, SMTP_HEALTHCHECK_INTERVAL,
+    WORKER_BOUNDS, STAGE_ENGINES, AUTOSCALE_INTERVAL, AUTOSCALE_TARGET_DRAIN,
+    PIPELINE_TRANSPORT, SHM_RING_CAPACITY, FILTER_BATCH_SIZE, FILTER_BATCH_WAIT_MS, STATS_WINDOWS,
+    PIPELINE_GRAPH_FILE, PIPELINE_REORDER_STAGES, PIPELINE_FUSE_STAGES,
+    PIPELINE_MAX_IN_FLIGHT, PIPELINE_QUEUE_SIZE, INGEST_BATCH_SIZE, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_TEXT_LENGTH
+)
+
+FILTERS = {filter_cls.__name__: filter_cls for filter_cls in (ScreamingFilter, ProfanityFilter, EmailFilter)}
+
+def email_config() -> dict:
+    return {
+        'sender': EMAIL_SENDER,
+        'password': EMAIL_PASSWORD,
+        'recipients': EMAIL_RECIPIENTS,
+        'pool_size': EMAIL_SMTP_POOL_SIZE,
+        'healthcheck_interval': SMTP_HEALTHCHECK_INTERVAL
+    }
+
+def default_graph(bounds: dict[str, tuple[int, int]], engines: dict[str, str], max_in_flight: int) -> PipelineGraph:
+    return (
+        PipelineGraph(PIPELINE_QUEUE_SIZE)
+        .stage('screaming', ScreamingFilter, workers=bounds['screaming'], engine=engines['screaming'],
+               batch_size=FILTER_BATCH_SIZE, batch_wait_ms=FILTER_BATCH_WAIT_MS)
+        .stage('profanity', ProfanityFilter, workers=bounds['profanity'], engine=engines['profanity'],
+               batch_size=FILTER_BATCH_SIZE, batch_wait_ms=FILTER_BATCH_WAIT_MS, emit_batches=False,
+               bad_words=BAD_WORDS)
+        .stage('email', EmailFilter, workers=bounds['email'], engine=engines['email'],
+               batch_size=EMAIL_SMTP_POOL_SIZE, email_config=email_config())
+        .edge(SOURCE, 'screaming', maxsize=max_in_flight)
+        .chain('screaming', 'profanity', 'email', SINK)
+        .resume('email')
+    )
+
+def load_graph(path: str) -> PipelineGraph:
+    with open(path) as f:
+        graph = PipelineGraph.from_dict(json.load(f), FILTERS)
+    for stage in graph.stages.values():
+        if stage.filter_cls is ProfanityFilter:
+            stage.kwargs.setdefault('bad_words', BAD_WORDS)
+        elif stage.filter_cls is EmailFilter:
+            stage.kwargs.setdefault('email_config', email_config())
+    return graph
+
+class PipelineOverloaded(Exception):
+    def __init__(self, retry_after: int, reason: str = "Pipeline is at capacity"):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+class PipelineUnavailable(PipelineOverloaded):
+    pass
 
 class Pipeline:
-    def __init__(self):
+    def __init__(self, worker_bounds: dict[str, tuple[int, int]] | None = None,
+                 transport: str = PIPELINE_TRANSPORT, max_in_flight: int = PIPELINE_MAX_IN_FLIGHT,
+                 engines: dict[str, str] | None = None, graph: PipelineGraph | None = None,
+                 optimize: bool = True):
+        if transport not in ('queue', 'shm'):
+            raise ValueError(f"Unknown pipeline transport: {transport}")
+        self.transport = transport
+        self.channels = []
+        self.max_in_flight = max_in_flight
+        self.retry_after = 1
+        
         self.shutdown_event = Event()
         self.stats = PipelineStats()
-        self.sink_pipe = Queue()
-        
-        self.email = EmailFilter(
-            outputs=[self.sink_pipe],
-            email_config={
-                'sender': EMAIL_SENDER,
-                'password': EMAIL_PASSWORD,
-                'recipients': EMAIL_RECIPIENTS
-            }
-        )
-        self.profanity = ProfanityFilter(
-            outputs=[self.email.input],
-            bad_words=BAD_WORDS
-        )
-        self.screaming = ScreamingFilter(outputs=[self.profanity.input])
+        self.started_at = time.time()
+        self.metrics = MetricsRegistry()
+        self.request_seconds = self.metrics.histogram(
+            'pipeline_request_seconds', 'End-to-end latency of messages through the pipeline')
+        self.in_flight = self.metrics.gauge(
+            'pipeline_requests_in_flight', 'Messages submitted to the pipeline awaiting a result')
+        self.cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_TEXT_LENGTH)
+        self.cache_hits = self.metrics.counter(
+            'pipeline_cache_lookups_total', 'Result cache lookups by outcome', result='hit')
+        self.cache_misses = self.metrics.counter(
+            'pipeline_cache_lookups_total', 'Result cache lookups by outcome', result='miss')
+        self.cache_entries = self.metrics.gauge('pipeline_cache_entries', 'Texts held in the result cache')
+        self.cache_bytes = self.metrics.gauge('pipeline_cache_bytes', 'Approximate memory held by the result cache')
+        if graph is None:
+            graph = load_graph(PIPELINE_GRAPH_FILE) if PIPELINE_GRAPH_FILE else default_graph(
+                {**WORKER_BOUNDS, **(worker_bounds or {})}, {**STAGE_ENGINES, **(engines or {})}, max_in_flight)
+        self.graph = graph.optimize(PIPELINE_REORDER_STAGES, PIPELINE_FUSE_STAGES) if optimize else graph.validate()
+        self.pending: dict[int, asyncio.Future] = {}
+        self.message_ids = itertools.count()
+        self.dispatcher = Thread(target=self._dispatch_results, daemon=True)
+        self.autoscaler = Thread(target=self._autoscale, daemon=True)
         
-        self.filters = [self.screaming, self.profanity, self.email]
-        self.source_pipe = self.screaming.input
+        inputs = {}
+        for name in [*self.graph.stages, SINK]:
+            producers = [self.graph.stages[source] for source in self.graph.sources(name) if source != SOURCE]
+            consumer = self.graph.stages[name].engine if name != SINK else 'thread'
+            in_process = consumer == 'thread' and all(stage.engine == 'thread' for stage in producers)
+            inputs[name] = self._make_channel(self.graph.capacity(name), in_process)
+        
+        labels = [stage.label for stage in self.graph.stages.values()]
+        self.stages: dict[str, FilterPool] = {}
+        for name in self.graph.topological_order():
+            stage = self.graph.stages[name]
+            self.stages[name] = FilterPool(
+                stage.filter_cls,
+                outputs=[inputs[target] for target in self.graph.targets(name)],
+                min_workers=stage.workers[0],
+                max_workers=stage.workers[1],
+                input_queue=inputs[name],
+                batch_size=stage.batch_size,
+                batch_wait_ms=stage.batch_wait_ms,
+                emit_batches=stage.emit_batches,
+                registry=self.metrics,
+                stats_window=max(STATS_WINDOWS),
+                engine=stage.engine,
+                name=stage.label if labels.count(stage.label) == 1 else name,
+                **stage.filter_kwargs()
+            )
+        
+        self.pools = list(self.stages.values())
+        self.sink_pipe = inputs[SINK]
+        self.source_pipe = inputs[self.graph.targets(SOURCE)[0]]
+        self.resume_pipe = inputs[self.graph.resume_stage] if self.graph.resume_stage is not None else None
+
+    def _make_channel(self, maxsize: int, in_process: bool = False) -> CountingQueue:
+        if in_process:
+            return CountingQueue(queue.Queue(maxsize))
+        channel = RingQueue(SHM_RING_CAPACITY, maxsize) if self.transport == 'shm' else Queue(maxsize)
+        self.channels.append(channel)
+        return CountingQueue(channel)
 
     def start(self):
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
         
-        for f in self.filters:
-            f.start()
+        for pool in self.pools:
+            pool.start()
+        self.dispatcher.start()
+        self.autoscaler.start()
 
-    def process_message(self, content: str) -> str:
+    async def process_message(self, content: str) -> str:
+        return (await self.process_messages([content]))[0]
+
+    async def process_messages(self, contents: list[str]) -> list[str | None]:
+        chunk_size = max(1, min(INGEST_BATCH_SIZE, self.max_in_flight))
+        if len(contents) <= chunk_size:
+            return await self._process_chunk(contents)
+        
+        chunks = [contents[offset:offset + chunk_size] for offset in range(0, len(contents), chunk_size)]
+        self._admit(len(chunks[0]))
+        slots = asyncio.Semaphore(max(1, self.max_in_flight // chunk_size))
+        
+        async def process(chunk: list[str]) -> list[str | None]:
+            async with slots:
+                try:
+                    return await self._process_chunk(chunk)
+                except PipelineOverloaded:
+                    return [None] * len(chunk)
+        
+        results = await asyncio.gather(*(process(chunk) for chunk in chunks))
+        return [result for chunk in results for result in chunk]
+
+    async def _process_chunk(self, contents: list[str]) -> list[str | None]:
         start_time = time.time()
+        self._admit(len(contents))
+        loop = asyncio.get_running_loop()
+        created_at = datetime.now()
+        generation = self.cache.generation
+        messages = []
+        futures = []
+        misses = []
+        hits = []
+        cacheable = []
+        for content in contents:
+            message_id = next(self.message_ids)
+            future = loop.create_future()
+            self.pending[message_id] = future
+            futures.append(future)
+            
+            cached = self.cache.get(content)
+            if cached is None:
+                message = Message(id=message_id, content=content, created_at=created_at)
+                misses.append(message)
+                cacheable.append(True)
+            else:
+                message = Message(id=message_id, content=cached, created_at=created_at)
+                hits.append(message)
+                cacheable.append(False)
+            messages.append(message)
+        self.cache_hits.inc(len(hits))
+        self.cache_misses.inc(len(misses))
         
-        self.source_pipe.put(Message(
-            content=content,
-            created_at=datetime.now()
-        ))
+        rejected = self._submit(self.source_pipe, misses)
+        if self.resume_pipe is not None:
+            rejected += self._submit(self.resume_pipe, hits)
+        else:
+            for message in hits:
+                self.pending[message.id].set_result(message.content)
+        if len(rejected) == len(messages):
+            for message in messages:
+                self.pending.pop(message.id, None)
+            self._requests('rejected').inc(len(messages))
+            raise PipelineOverloaded(self.retry_after)
+        for message in rejected:
+            self.pending.pop(message.id).set_result(None)
         
-        result = self.sink_pipe.get()
+        try:
+            results = await asyncio.gather(*futures)
+        except BaseException:
+            self._requests('error').inc(len(messages))
+            raise
+        finally:
+            for message in messages:
+                self.pending.pop(message.id, None)
         
         processing_time = time.time() - start_time
-        self.stats.messages_processed += 1
-        self.stats.total_processing_time += processing_time
-        self.stats.max_latency = max(self.stats.max_latency, processing_time)
-        self.stats.min_latency = min(self.stats.min_latency, processing_time)
-        
-        return result.content
+        for content, result, miss in zip(contents, results, cacheable):
+            if result is None:
+                self._requests('rejected').inc()
+                continue
+            self._record_result(processing_time, result)
+            if miss:
+                self.cache.put(content, result, generation)
+        return results
+
+    def _submit(self, pipe, messages: list[Message]) -> list[Message]:
+        for offset in range(0, len(messages), FILTER_BATCH_SIZE):
+            chunk = messages[offset:offset + FILTER_BATCH_SIZE]
+            try:
+                pipe.put_nowait(chunk[0] if len(chunk) == 1 else MessageBatch(chunk))
+            except queue.Full:
+                return messages[offset:]
+        return []
+
+    async def update_bad_words(self, bad_words: list[str]):
+        await asyncio.get_running_loop().run_in_executor(
+            None, partial(self.restart_filter, ProfanityFilter, bad_words=bad_words)
+        )
+        self.cache.invalidate()
+
+    def restart_filter(self, filter_cls: type[Filter], **filter_kwargs):
+        for name, pool in self.stages.items():
+            stage = self.graph.stages[name]
+            members = stage.find(filter_cls)
+            if not members:
+                continue
+            for member in members:
+                member.kwargs.update(filter_kwargs)
+            pool.restart(**stage.filter_kwargs())
+
+    def _admit(self, count: int):
+        if self.shutdown_event.is_set():
+            raise PipelineUnavailable(self.retry_after, "Pipeline is shutting down")
+        if len(self.pending) + count > self.max_in_flight:
+            self._requests('rejected').inc(count)
+            raise PipelineOverloaded(self.retry_after)
+
+    def _record_result(self, processing_time: float, result: str):
+        self.request_seconds.observe(processing_time)
+        self._requests('success' if result else 'filtered').inc()
+        self.stats.record(processing_time)
+
+    def _requests(self, status: str):
+        return self.metrics.counter(
+            'pipeline_requests_total', 'Messages completed by the pipeline by outcome', status=status)
+
+    def render_metrics(self) -> str:
+        for pool in self.pools:
+            depth = pool.depth()
+            if depth is not None:
+                pool.metrics.queue_depth.set(depth)
+        self.in_flight.set(len(self.pending))
+        self.cache_entries.set(len(self.cache))
+        self.cache_bytes.set(self.cache.size)
+        return self.metrics.render()
+
+    def stats_snapshot(self) -> dict:
+        now = time.time()
+        uptime = now - self.started_at
+        windows = {}
+        for seconds in STATS_WINDOWS:
+            elapsed = min(seconds, uptime)
+            windows[f'{seconds}s'] = {
+                'end_to_end': self.stats.latency.window(seconds, now).summary(elapsed),
+                'stages': {
+                    pool.name: pool.latency.window(seconds, now).summary(elapsed)
+                    for pool in self.pools
+                }
+            }
+        return {
+            'uptime_s': uptime,
+            'in_flight': len(self.pending),
+            'windows': windows,
+            'total': {
+                'end_to_end': self.stats.latency.cumulative().summary(uptime),
+                'stages': {pool.name: pool.latency.cumulative().summary(uptime) for pool in self.pools}
+            }
+        }
+
+    def _dispatch_results(self):
+        while True:
+            result = self.sink_pipe.get()
+            if result is None:
+                break
+            
+            messages = result.messages if isinstance(result, MessageBatch) else [result]
+            for message in messages:
+                future = self.pending.pop(message.id, None)
+                if future is not None:
+                    future.get_loop().call_soon_threadsafe(_resolve, future, message.content)
+
+    def _autoscale(self):
+        while not self.shutdown_event.wait(AUTOSCALE_INTERVAL):
+            self._update_retry_after()
+            for pool in self.pools:
+                depth = pool.depth()
+                if depth is None:
+                    depth = len(self.pending)
+                service_time = pool.sample_service_time()
+                
+                capacity = AUTOSCALE_TARGET_DRAIN * pool.concurrency
+                needed = math.ceil(depth * service_time / capacity)
+                if needed > pool.size:
+                    target = needed
+                elif depth == 0:
+                    target = pool.size - 1
+                else:
+                    continue
+                
+                size = pool.size
+                if pool.resize(target) != size:
+                    print(f"Scaled {pool.name} from {size} to {pool.size} workers "
+                          f"(depth={depth}, service_time={service_time * 1000:.1f}ms)")
+
+    def _update_retry_after(self):
+        window = min(STATS_WINDOWS)
+        recent = self.stats.latency.window(window)
+        throughput = recent.count / min(window, max(time.time() - self.started_at, AUTOSCALE_INTERVAL))
+        if throughput > 0:
+            self.retry_after = max(1, min(60, math.ceil(len(self.pending) / throughput)))
+        else:
+            self.retry_after = 1
 
     def shutdown(self):
         print("\nShutting down pipeline...")
         self.shutdown_event.set()
+        if self.autoscaler.is_alive():
+            self.autoscaler.join(timeout=5.0)
         
-        for f in self.filters:
-            f.join(timeout=5.0)
-            if f.is_alive():
-                f.terminate()
+        for pool in self.pools:
+            pool.shutdown()
+        
+        if self.dispatcher.is_alive():
+            self.sink_pipe.put(None)
+            self.dispatcher.join(timeout=5.0)
+        
+        for future in list(self.pending.values()):
+            future.get_loop().call_soon_threadsafe(future.cancel)
+        self.pending.clear()
+        
+        if self.transport == 'shm':
+            for channel in self.channels:
+                channel.close()
         
         print("\nPipeline Statistics:")
         print(f"Messages Processed: {self.stats.messages_processed}")
         print(f"Average Processing Time: {self.stats.avg_processing_time:.3f}s")
         print(f"Maximum Latency: {self.stats.max_latency:.3f}s")
         print(f"Minimum Latency: {self.stats.min_latency:.3f}s")
+        latency = self.stats.latency.cumulative()
+        print(f"p50/p95/p99 Latency: {latency.quantile(0.5):.3f}s / "
+              f"{latency.quantile(0.95):.3f}s / {latency.quantile(0.99):.3f}s")
 
     def _signal_handler(self, signum, frame):
         self.shutdown()
         sys.exit(0)
 
-def run_performance_test():
+def _resolve(future: asyncio.Future, content: str):
+    if not future.done():
+        future.set_result(content)
+
+async def run_performance_test():
     pipeline = Pipeline()
     pipeline.start()
     
@@ -88,12 +408,12 @@ def run_performance_test():
     ] * 20
     
     try:
-        for msg in messages:
-            result = pipeline.process_message(msg)
+        results = await asyncio.gather(*(pipeline.process_message(msg) for msg in messages))
+        for msg, result in zip(messages, results):
             print(f"Input: {msg}")
             print(f"Output: {result}\n")
     finally:
         pipeline.shutdown()
 
 if __name__ == "__main__":
-    run_performance_test()
\ No newline at end of file
+    asyncio.run(run_performance_test())
\ No newline at end of file
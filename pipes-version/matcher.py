@@ -0,0 +1,61 @@
+import re
+from bisect import bisect_right
+
+SEPARATOR = '\0'
+
+class StopWordMatcher:
+    def __init__(self, words: list[str]):
+        self.words = sorted({word.lower() for word in words if word and SEPARATOR not in word})
+        self.pattern = re.compile(_build_pattern(self.words)) if self.words else None
+
+    def search(self, text: str) -> str | None:
+        if self.pattern is None:
+            return None
+        match = self.pattern.search(text.lower())
+        return match.group() if match else None
+
+    def contains(self, text: str) -> bool:
+        return self.search(text) is not None
+
+    def scan_batch(self, texts: list[str]) -> list[bool]:
+        results = [False] * len(texts)
+        if self.pattern is None or not texts:
+            return results
+
+        lowered = [text.lower() for text in texts]
+        starts = []
+        offset = 0
+        for text in lowered:
+            starts.append(offset)
+            offset += len(text) + 1
+
+        haystack = SEPARATOR.join(lowered)
+        position = 0
+        while True:
+            match = self.pattern.search(haystack, position)
+            if match is None:
+                break
+            index = bisect_right(starts, match.start()) - 1
+            results[index] = True
+            if index + 1 == len(starts):
+                break
+            position = starts[index + 1]
+        return results
+
+def _build_pattern(words: list[str]) -> str:
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return _node_pattern(trie)
+
+def _node_pattern(node: dict) -> str:
+    if '' in node:
+        return ''
+
+    alternatives = [re.escape(char) + _node_pattern(child) for char, child in sorted(node.items())]
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return '(?:' + '|'.join(alternatives) + ')'
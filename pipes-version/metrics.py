@@ -0,0 +1,153 @@
+from bisect import bisect_left
+from multiprocessing import Lock, RawArray
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: dict[str, str]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: dict[str, str]):
+        super().__init__(name, help, labels)
+        self.value = RawArray('d', 1)
+        self.lock = Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value[0] += amount
+
+    def get(self) -> float:
+        return self.value[0]
+
+    def samples(self):
+        return [(self.name, self.labels, self.value[0])]
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float):
+        self.value[0] = value
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: dict[str, str], buckets: tuple[float, ...]):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = RawArray('d', len(self.buckets) + 1)
+        self.totals = RawArray('d', 2)
+        self.lock = Lock()
+
+    def observe(self, value: float, count: int = 1):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += count
+            self.totals[0] += value * count
+            self.totals[1] += count
+
+    def observe_many(self, values: list[float]):
+        indexes = [bisect_left(self.buckets, value) for value in values]
+        with self.lock:
+            for index in indexes:
+                self.counts[index] += 1
+            self.totals[0] += sum(values)
+            self.totals[1] += len(values)
+
+    @property
+    def sum(self) -> float:
+        return self.totals[0]
+
+    @property
+    def count(self) -> float:
+        return self.totals[1]
+
+    def samples(self):
+        with self.lock:
+            counts = self.counts[:]
+            total, count = self.totals[:]
+
+        samples = []
+        cumulative = 0.0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append((f'{self.name}_bucket', {**self.labels, 'le': le}, cumulative))
+        samples.append((f'{self.name}_sum', self.labels, total))
+        samples.append((f'{self.name}_count', self.labels, count))
+        return samples
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[tuple, Metric] = {}
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        return self._get_or_create(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, **labels: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+                  **labels: str) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labels, buckets)
+
+    def _get_or_create(self, metric_cls: type[Metric], name: str, help: str, labels: dict, *args):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            metric = metric_cls(name, help, labels, *args)
+            self.metrics[key] = metric
+        elif not isinstance(metric, metric_cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        described = set()
+        for metric in sorted(self.metrics.values(), key=lambda m: m.name):
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+class StageMetrics:
+    def __init__(self, registry: MetricsRegistry, stage: str):
+        self.messages = registry.counter(
+            'pipeline_stage_messages_total', 'Messages processed by a pipeline stage', stage=stage)
+        self.errors = registry.counter(
+            'pipeline_stage_errors_total', 'Messages a pipeline stage failed to process', stage=stage)
+        self.lag = registry.histogram(
+            'pipeline_stage_lag_seconds', 'Time from message creation until a stage picked it up', stage=stage)
+        self.service_time = registry.histogram(
+            'pipeline_stage_service_seconds', 'Per-message processing time of a stage', stage=stage)
+        self.workers = registry.gauge(
+            'pipeline_stage_workers', 'Worker processes running a stage', stage=stage)
+        self.queue_depth = registry.gauge(
+            'pipeline_stage_queue_depth', 'Messages waiting in a stage input queue', stage=stage)
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + '}'
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
@@ -1,37 +1,68 @@
-from filter import Filter
-import yagmail
-import asyncio
+from multiprocessing import Queue
+from concurrent.futures import ThreadPoolExecutor, Future
+from filter import Filter, Message
+from matcher import StopWordMatcher
+from smtp_pool import SMTPPool
+import threading
+from functools import partial
 import time
 
 class ScreamingFilter(Filter):
+    cheap = True
+    commutative = True
+
     def _process(self, content: str) -> str:
         return content.upper()
 
 class ProfanityFilter(Filter):
-    def __init__(self, outputs: list, bad_words: list[str]):
-        super().__init__(outputs)
+    cheap = True
+    commutative = True
+    rejects = True
+
+    def __init__(self, outputs: list, bad_words: list[str], input_queue: Queue = None):
+        super().__init__(outputs, input_queue)
         self.bad_words = bad_words
+        self.matcher = StopWordMatcher(bad_words)
 
     def _process(self, content: str) -> str:
-        for word in self.bad_words:
-            if word.lower() in content.lower():
-                return ""
+        if self.matcher.contains(content):
+            return ""
         return content
 
+    def _process_batch(self, contents: list[str]) -> list[str]:
+        blocked = self.matcher.scan_batch(contents)
+        return ["" if is_blocked else content for content, is_blocked in zip(contents, blocked)]
+
 class EmailFilter(Filter):
-    def __init__(self, outputs: list, email_config: dict):
-        super().__init__(outputs)
+    def __init__(self, outputs: list, email_config: dict, input_queue: Queue = None):
+        super().__init__(outputs, input_queue)
         self.email_sender = email_config.get('sender', '')
         self.email_password = email_config.get('password', '')
         self.email_recipients = email_config.get('recipients', [])
+        self.concurrency = max(1, email_config.get('pool_size', 1))
+        self.healthcheck_interval = email_config.get('healthcheck_interval', 30.0)
+        
+        self.smtp_pool = None
+        self.executor = None
+        self.slots = None
+
+    def _setup(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.slots = threading.BoundedSemaphore(self.concurrency)
         
-        self.email_client = None
         if all([self.email_sender, self.email_password, self.email_recipients]):
-            try:
-                self.email_client = yagmail.SMTP(self.email_sender, self.email_password)
-                print("Email client initialized successfully")
-            except Exception as e:
-                print(f"Failed to initialize email client: {str(e)}")
+            self.smtp_pool = SMTPPool(
+                self.email_sender,
+                self.email_password,
+                size=self.concurrency,
+                healthcheck_interval=self.healthcheck_interval
+            )
+            print(f"SMTP pool initialized with up to {self.concurrency} connections")
+
+    def _teardown(self):
+        self.executor.shutdown(wait=True)
+        if self.smtp_pool is not None:
+            self.smtp_pool.close()
 
     def _simulate_email_send(self, content: str):
         time.sleep(0.1 + (time.time() % 0.1))
@@ -40,20 +71,45 @@ class EmailFilter(Filter):
         print(f"Subject: New Message")
         print(f"Body: {content}\n")
 
+    def _handle_batch(self, messages: list[Message]):
+        for data in messages:
+            if not data.content:
+                self._emit(data, data.content)
+                continue
+            
+            self.slots.acquire()
+            start_time = time.perf_counter()
+            future = self.executor.submit(self._process, data.content)
+            future.add_done_callback(partial(self._on_sent, data, start_time))
+
+    def _on_sent(self, data: Message, start_time: float, future: Future):
+        self.slots.release()
+        self._record_processed(time.perf_counter() - start_time)
+        
+        try:
+            content = future.result()
+        except Exception as e:
+            print(f"Email stage failed: {str(e)}")
+            if self.metrics is not None:
+                self.metrics.errors.inc()
+            content = data.content
+        self._emit(data, content)
+
     def _process(self, content: str) -> str:
         if not content:
             return content
             
-        if self.email_client is not None:
+        if self.smtp_pool is not None:
             try:
-                self.email_client.send(
+                self.smtp_pool.send(
                     to=self.email_recipients,
                     subject="New Message",
                     contents=content
                 )
-                print(f"Real email sent to {', '.join(self.email_recipients)}")
             except Exception as e:
                 print(f"Failed to send real email: {str(e)}")
+                if self.metrics is not None:
+                    self.metrics.errors.inc()
                 self._simulate_email_send(content)
         else:
             self._simulate_email_send(content)
@@ -0,0 +1,149 @@
+import queue
+import struct
+import time
+from datetime import datetime
+from multiprocessing import Lock, shared_memory
+
+from filter import Message, MessageBatch
+
+CONTROL = struct.Struct('QQQ')
+RECORD = struct.Struct('IBqd')
+
+KIND_MESSAGE = 0
+KIND_STOP = 1
+KIND_PAD = 2
+KIND_BATCH = 3
+
+MIN_BACKOFF = 0.00005
+MAX_BACKOFF = 0.001
+
+class RingQueue:
+    def __init__(self, capacity: int = 4 * 1024 * 1024, maxsize: int = 0):
+        self.capacity = capacity
+        self.maxsize = maxsize
+        self.shm = shared_memory.SharedMemory(create=True, size=CONTROL.size + capacity)
+        CONTROL.pack_into(self.shm.buf, 0, 0, 0, 0)
+        self.lock = Lock()
+        self.owner = True
+
+    def __getstate__(self):
+        return self.shm.name, self.capacity, self.maxsize, self.lock
+
+    def __setstate__(self, state):
+        name, self.capacity, self.maxsize, self.lock = state
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = False
+
+    def put(self, item: Message | MessageBatch | None, block: bool = True, timeout: float | None = None):
+        if item is None:
+            kind, message_id, created_at, payload = KIND_STOP, 0, 0.0, b''
+        elif isinstance(item, MessageBatch):
+            kind, message_id, created_at = KIND_BATCH, len(item.messages), 0.0
+            payload = b''.join(_encode_record(message) for message in item.messages)
+        else:
+            kind, message_id, created_at = KIND_MESSAGE, item.id, item.created_at.timestamp()
+            payload = item.content.encode()
+
+        size = RECORD.size + len(payload)
+        if size > self.capacity:
+            raise ValueError(f"Record of {size} bytes does not fit a {self.capacity} byte ring")
+
+        self._wait(lambda: self._try_put(kind, message_id, created_at, payload, size), block, timeout, queue.Full)
+
+    def put_nowait(self, item: Message | MessageBatch | None):
+        self.put(item, block=False)
+
+    def get(self, block: bool = True, timeout: float | None = None) -> Message | MessageBatch | None:
+        return self._wait(self._try_get, block, timeout, queue.Empty)
+
+    def get_nowait(self) -> Message | MessageBatch | None:
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        return CONTROL.unpack_from(self.shm.buf, 0)[2]
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def _wait(self, attempt, block: bool, timeout: float | None, error: type[Exception]):
+        backoff = MIN_BACKOFF
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            done, result = attempt()
+            if done:
+                return result
+            if not block or (deadline is not None and time.monotonic() >= deadline):
+                raise error
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def _try_put(self, kind: int, message_id: int, created_at: float, payload: bytes, size: int):
+        buf = self.shm.buf
+        with self.lock:
+            head, tail, count = CONTROL.unpack_from(buf, 0)
+            position = tail % self.capacity
+            padding = self.capacity - position if self.capacity - position < size else 0
+            if tail - head + padding + size > self.capacity or 0 < self.maxsize <= count:
+                return False, None
+
+            if padding:
+                if padding >= RECORD.size:
+                    RECORD.pack_into(buf, CONTROL.size + position, 0, KIND_PAD, 0, 0.0)
+                position = 0
+
+            offset = CONTROL.size + position
+            RECORD.pack_into(buf, offset, len(payload), kind, message_id, created_at)
+            buf[offset + RECORD.size:offset + size] = payload
+            CONTROL.pack_into(buf, 0, head, tail + padding + size, count + 1)
+        return True, None
+
+    def _try_get(self):
+        buf = self.shm.buf
+        with self.lock:
+            head, tail, count = CONTROL.unpack_from(buf, 0)
+            if head == tail:
+                return False, None
+
+            position = head % self.capacity
+            remaining = self.capacity - position
+            if remaining < RECORD.size or RECORD.unpack_from(buf, CONTROL.size + position)[1] == KIND_PAD:
+                head += remaining
+                position = 0
+
+            offset = CONTROL.size + position
+            length, kind, message_id, created_at = RECORD.unpack_from(buf, offset)
+            payload = bytes(buf[offset + RECORD.size:offset + RECORD.size + length])
+            CONTROL.pack_into(buf, 0, head + RECORD.size + length, tail, count - 1)
+
+        if kind == KIND_STOP:
+            return True, None
+        if kind == KIND_BATCH:
+            return True, MessageBatch(_decode_records(payload, message_id))
+        return True, Message(
+            id=message_id,
+            content=payload.decode(),
+            created_at=datetime.fromtimestamp(created_at)
+        )
+
+def _encode_record(message: Message) -> bytes:
+    content = message.content.encode()
+    return RECORD.pack(len(content), KIND_MESSAGE, message.id, message.created_at.timestamp()) + content
+
+def _decode_records(payload: bytes, count: int) -> list[Message]:
+    messages = []
+    offset = 0
+    for _ in range(count):
+        length, _, message_id, created_at = RECORD.unpack_from(payload, offset)
+        offset += RECORD.size
+        messages.append(Message(
+            id=message_id,
+            content=payload[offset:offset + length].decode(),
+            created_at=datetime.fromtimestamp(created_at)
+        ))
+        offset += length
+    return messages
@@ -0,0 +1,80 @@
+import queue
+import smtplib
+import threading
+import time
+import yagmail
+
+class SMTPPool:
+    def __init__(self, sender: str, password: str, size: int, healthcheck_interval: float = 30.0):
+        self.sender = sender
+        self.password = password
+        self.size = max(1, size)
+        self.healthcheck_interval = healthcheck_interval
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def send(self, to: list[str], subject: str, contents: str):
+        client = self._acquire()
+        try:
+            recipients, msg_strings = client.prepare_send(
+                to=to,
+                subject=subject,
+                contents=contents
+            )
+            client.smtp.sendmail(client.user, recipients, msg_strings)
+        except Exception:
+            self._discard(client)
+            raise
+        self.idle.put((client, time.monotonic()))
+
+    def close(self):
+        while True:
+            try:
+                client, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(client)
+
+    def _acquire(self) -> yagmail.SMTP:
+        try:
+            client, last_used = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_create = self.created < self.size
+                if can_create:
+                    self.created += 1
+            if can_create:
+                return self._connect()
+            client, last_used = self.idle.get()
+
+        if time.monotonic() - last_used > self.healthcheck_interval and not self._is_healthy(client):
+            client.close()
+            try:
+                client.login()
+            except Exception:
+                self._discard(client)
+                raise
+        return client
+
+    def _connect(self) -> yagmail.SMTP:
+        try:
+            client = yagmail.SMTP(self.sender, self.password)
+            client.login()
+            return client
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    def _discard(self, client: yagmail.SMTP):
+        client.close()
+        with self.lock:
+            self.created -= 1
+
+    @staticmethod
+    def _is_healthy(client: yagmail.SMTP) -> bool:
+        try:
+            return client.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError, AttributeError):
+            return False
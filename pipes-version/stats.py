@@ -0,0 +1,109 @@
+import math
+import time
+from multiprocessing import Lock, RawArray
+
+MIN_LATENCY = 1e-5
+MAX_LATENCY = 100.0
+RELATIVE_ACCURACY = 0.02
+PERCENTILES = (50, 90, 95, 99)
+
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+INDEX_OFFSET = math.floor(math.log(MIN_LATENCY) / LOG_GAMMA)
+BUCKET_COUNT = math.ceil(math.log(MAX_LATENCY) / LOG_GAMMA) - INDEX_OFFSET + 1
+
+def bucket_index(value: float) -> int:
+    if value <= MIN_LATENCY:
+        return 0
+    return min(BUCKET_COUNT - 1, math.ceil(math.log(value) / LOG_GAMMA) - INDEX_OFFSET)
+
+def bucket_value(index: int) -> float:
+    if index == 0:
+        return MIN_LATENCY
+    return 2 * GAMMA ** (index + INDEX_OFFSET) / (GAMMA + 1)
+
+class LatencySnapshot:
+    def __init__(self, counts: list[float] | None = None, total: float = 0.0):
+        self.counts = counts if counts is not None else [0.0] * BUCKET_COUNT
+        self.total = total
+
+    @property
+    def count(self) -> int:
+        return int(sum(self.counts))
+
+    def merge(self, other: 'LatencySnapshot') -> 'LatencySnapshot':
+        return LatencySnapshot([a + b for a, b in zip(self.counts, other.counts)], self.total + other.total)
+
+    def quantile(self, q: float) -> float:
+        count = sum(self.counts)
+        if not count:
+            return 0.0
+        rank = q * (count - 1)
+        seen = 0.0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen > rank:
+                return bucket_value(index)
+        return bucket_value(BUCKET_COUNT - 1)
+
+    def summary(self, seconds: float | None = None) -> dict:
+        count = self.count
+        summary = {
+            'count': count,
+            'mean_ms': self.total / count * 1000 if count else 0.0,
+            **{f'p{p}_ms': self.quantile(p / 100) * 1000 for p in PERCENTILES},
+            'max_ms': self.quantile(1.0) * 1000,
+        }
+        if seconds:
+            summary['throughput'] = count / seconds
+        return summary
+
+class LatencyHistogram:
+    def __init__(self, window_slots: int = 60, slot_seconds: float = 1.0):
+        self.window_slots = window_slots
+        self.slot_seconds = slot_seconds
+        self.counts = RawArray('d', (window_slots + 1) * BUCKET_COUNT)
+        self.totals = RawArray('d', window_slots + 1)
+        self.epochs = RawArray('q', window_slots)
+        self.lock = Lock()
+
+    def record(self, value: float):
+        self.record_many([value])
+
+    def record_many(self, values: list[float], now: float | None = None):
+        indexes = [bucket_index(value) for value in values]
+        total = sum(values)
+        epoch = int((time.time() if now is None else now) // self.slot_seconds)
+        slot = epoch % self.window_slots
+        base = slot * BUCKET_COUNT
+        cumulative = self.window_slots * BUCKET_COUNT
+
+        with self.lock:
+            if self.epochs[slot] != epoch:
+                self.counts[base:base + BUCKET_COUNT] = [0.0] * BUCKET_COUNT
+                self.totals[slot] = 0.0
+                self.epochs[slot] = epoch
+            for index in indexes:
+                self.counts[base + index] += 1
+                self.counts[cumulative + index] += 1
+            self.totals[slot] += total
+            self.totals[self.window_slots] += total
+
+    def window(self, seconds: float, now: float | None = None) -> LatencySnapshot:
+        epoch = int((time.time() if now is None else now) // self.slot_seconds)
+        slots = min(self.window_slots, max(1, math.ceil(seconds / self.slot_seconds)))
+        snapshot = LatencySnapshot()
+
+        with self.lock:
+            for slot_epoch in range(epoch - slots + 1, epoch + 1):
+                slot = slot_epoch % self.window_slots
+                if self.epochs[slot] != slot_epoch:
+                    continue
+                base = slot * BUCKET_COUNT
+                snapshot = snapshot.merge(LatencySnapshot(self.counts[base:base + BUCKET_COUNT], self.totals[slot]))
+        return snapshot
+
+    def cumulative(self) -> LatencySnapshot:
+        base = self.window_slots * BUCKET_COUNT
+        with self.lock:
+            return LatencySnapshot(self.counts[base:base + BUCKET_COUNT], self.totals[self.window_slots])
@@ -1,13 +1,61 @@
 import os
-from typing import List
+from typing import List, Dict, Tuple
 from multiprocessing import Queue
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+from stats import LatencyHistogram
 
 STOP_WORDS: List[str] = ['bird-watching', 'ailurophobia', 'mango']
 
 EMAIL_SENDER = os.getenv('EMAIL_SENDER', '')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD', '')
 EMAIL_RECIPIENTS = os.getenv('EMAIL_RECIPIENTS', '').split(',')
+EMAIL_SMTP_POOL_SIZE = int(os.getenv('EMAIL_SMTP_POOL_SIZE', 4))
+SMTP_HEALTHCHECK_INTERVAL = float(os.getenv('SMTP_HEALTHCHECK_INTERVAL', 30.0))
+
+WORKER_BOUNDS: Dict[str, Tuple[int, int]] = {
+    'screaming': (
+        int(os.getenv('SCREAMING_MIN_WORKERS', 1)),
+        int(os.getenv('SCREAMING_MAX_WORKERS', 2))
+    ),
+    'profanity': (
+        int(os.getenv('PROFANITY_MIN_WORKERS', 1)),
+        int(os.getenv('PROFANITY_MAX_WORKERS', 2))
+    ),
+    'email': (
+        int(os.getenv('EMAIL_MIN_WORKERS', 1)),
+        int(os.getenv('EMAIL_MAX_WORKERS', 16))
+    ),
+}
+STAGE_ENGINES: Dict[str, str] = {
+    'screaming': os.getenv('SCREAMING_ENGINE', 'process'),
+    'profanity': os.getenv('PROFANITY_ENGINE', 'process'),
+    'email': os.getenv('EMAIL_ENGINE', 'process'),
+}
+FILTER_BATCH_SIZE = int(os.getenv('FILTER_BATCH_SIZE', 32))
+FILTER_BATCH_WAIT_MS = float(os.getenv('FILTER_BATCH_WAIT_MS', 0))
+
+PIPELINE_TRANSPORT = os.getenv('PIPELINE_TRANSPORT', 'queue')
+SHM_RING_CAPACITY = int(os.getenv('SHM_RING_CAPACITY', 4 * 1024 * 1024))
+
+AUTOSCALE_INTERVAL = float(os.getenv('AUTOSCALE_INTERVAL', 0.5))
+AUTOSCALE_TARGET_DRAIN = float(os.getenv('AUTOSCALE_TARGET_DRAIN', 0.2))
+
+PIPELINE_GRAPH_FILE = os.getenv('PIPELINE_GRAPH_FILE', '')
+PIPELINE_REORDER_STAGES = os.getenv('PIPELINE_REORDER_STAGES', 'true').lower() == 'true'
+PIPELINE_FUSE_STAGES = os.getenv('PIPELINE_FUSE_STAGES', 'true').lower() == 'true'
+
+PIPELINE_MAX_IN_FLIGHT = int(os.getenv('PIPELINE_MAX_IN_FLIGHT', 10000))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 1024))
+
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+RESULT_CACHE_MAX_TEXT_LENGTH = int(os.getenv('RESULT_CACHE_MAX_TEXT_LENGTH', 4096))
+
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 256))
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+STATS_WINDOWS: List[int] = [int(w) for w in os.getenv('STATS_WINDOWS', '10,60').split(',')]
 
 class Message:
     def __init__(self, text: str, user_alias: str):
@@ -26,6 +74,14 @@ class PipelineStats:
     total_processing_time: float = 0.0
     max_latency: float = 0.0
     min_latency: float = float('inf')
+    latency: LatencyHistogram = field(default_factory=lambda: LatencyHistogram(max(STATS_WINDOWS)))
+    
+    def record(self, processing_time: float):
+        self.messages_processed += 1
+        self.total_processing_time += processing_time
+        self.max_latency = max(self.max_latency, processing_time)
+        self.min_latency = min(self.min_latency, processing_time)
+        self.latency.record(processing_time)
     
     @property
     def avg_processing_time(self) -> float:
@@ -0,0 +1,53 @@
+import asyncio
+import math
+import time
+from typing import Optional
+
+from aio_pika.pool import Pool
+
+from transport import Channel
+
+MAX_RETRY_AFTER = 60
+
+class QueueDepthMonitor:
+    def __init__(self, queue_name: str, max_depth: int, interval: float, default_retry_after: int):
+        self.queue_name = queue_name
+        self.max_depth = max_depth
+        self.interval = interval
+        self.default_retry_after = default_retry_after
+        self.depth = 0
+        self.drain_rate = 0.0
+        self.checked_at: Optional[float] = None
+
+    def admit(self, count: int = 1) -> Optional[int]:
+        if self.max_depth and self.depth + count > self.max_depth:
+            return self.retry_after(count)
+        self.depth += count
+        return None
+
+    def retry_after(self, count: int = 1) -> int:
+        if self.drain_rate <= 0:
+            return self.default_retry_after
+        excess = self.depth + count - self.max_depth
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(excess / self.drain_rate)))
+
+    async def check(self, channel: Channel):
+        depth = await channel.queue_depth(self.queue_name)
+        now = time.monotonic()
+
+        if self.checked_at is not None:
+            drained = self.depth - depth
+            self.drain_rate = max(0.0, drained / (now - self.checked_at))
+        self.depth = depth
+        self.checked_at = now
+
+    async def run(self, channel_pool: Pool):
+        while True:
+            try:
+                async with channel_pool.acquire() as channel:
+                    await self.check(channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Queue depth check failed: {str(e)}")
+            await asyncio.sleep(self.interval)
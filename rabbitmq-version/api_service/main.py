@@ -1,54 +1,280 @@
 import asyncio
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import aio_pika
+import glob
+import json
+import tempfile
+import time
+from typing import List, Optional, Tuple, Union
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
+from pydantic import BaseModel, ValidationError, field_validator
+from aio_pika.pool import Pool
 import sys
 import os
 from contextlib import asynccontextmanager
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import get_rabbitmq_url, FILTER_QUEUE
+from utils import (
+    get_rabbitmq_url, encode_message, FILTER_QUEUE, INGEST_BATCH_SIZE,
+    API_WORKERS, API_METRICS_DIR, API_METRICS_DUMP_INTERVAL, API_CHANNEL_POOL_SIZE, API_PUBLISHER_CONFIRMS,
+    API_MAX_IN_FLIGHT, API_MAX_QUEUE_DEPTH, QUEUE_DEPTH_CHECK_INTERVAL, ADMISSION_RETRY_AFTER,
+    MAX_IDEMPOTENCY_KEY_LENGTH
+)
+from metrics import registry, merge_dumps, render_records
+from admission import QueueDepthMonitor
+from transport import AmqpTransport, Channel
+from tracing import Span, Tracer
+
+ADMISSION_BATCH_SIZE = max(1, min(INGEST_BATCH_SIZE, API_MAX_IN_FLIGHT))
+MAX_BATCHES_IN_FLIGHT = max(1, API_MAX_IN_FLIGHT // ADMISSION_BATCH_SIZE)
+
+publish_seconds = registry.histogram('api_publish_seconds', 'Time to publish a message to the filter queue')
+tracer = Tracer('api')
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.rabbitmq = await get_rabbitmq_connection()
-    app.state.channel = await app.state.rabbitmq.channel()
-    await app.state.channel.declare_queue(FILTER_QUEUE, durable=True)
+    owns_transport = getattr(app.state, 'transport', None) is None
+    if owns_transport:
+        app.state.transport = AmqpTransport(get_rabbitmq_url())
+        await app.state.transport.connect()
+    app.state.channel_pool = Pool(get_channel, max_size=API_CHANNEL_POOL_SIZE)
+    async with app.state.channel_pool.acquire() as channel:
+        await channel.declare_queue(FILTER_QUEUE)
+    app.state.in_flight = 0
+    app.state.queue_monitor = QueueDepthMonitor(
+        FILTER_QUEUE, API_MAX_QUEUE_DEPTH, QUEUE_DEPTH_CHECK_INTERVAL, ADMISSION_RETRY_AFTER
+    )
+    monitor = asyncio.create_task(app.state.queue_monitor.run(app.state.channel_pool))
+    app.state.metrics_path = None
+    if API_WORKERS > 1:
+        metrics_dir = API_METRICS_DIR or os.path.join(tempfile.gettempdir(), f"api-metrics-{os.getppid()}")
+        os.makedirs(metrics_dir, exist_ok=True)
+        app.state.metrics_path = os.path.join(metrics_dir, f"{os.getpid()}.json")
+        dumper = asyncio.create_task(_dump_metrics(app.state.metrics_path))
     
     yield
     
-    await app.state.rabbitmq.close()
+    monitor.cancel()
+    if app.state.metrics_path is not None:
+        dumper.cancel()
+        os.remove(app.state.metrics_path)
+    await app.state.channel_pool.close()
+    if owns_transport:
+        await app.state.transport.close()
 
 app = FastAPI(title="Message API Service", lifespan=lifespan)
 
+def _key_too_long(key: Optional[str]) -> bool:
+    return key is not None and len(key.encode()) > MAX_IDEMPOTENCY_KEY_LENGTH
+
 class Message(BaseModel):
     text: str
     user_alias: str
+    idempotency_key: Optional[str] = None
+
+    @field_validator('idempotency_key')
+    @classmethod
+    def check_idempotency_key(cls, key: Optional[str]) -> Optional[str]:
+        if _key_too_long(key):
+            raise ValueError(f"must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} bytes in UTF-8")
+        return key
 
-async def get_rabbitmq_connection():
-    return await aio_pika.connect_robust(get_rabbitmq_url())
+async def get_channel() -> Channel:
+    return await app.state.transport.channel(publisher_confirms=API_PUBLISHER_CONFIRMS)
 
 @app.post("/message")
-async def send_message(message: Message):
-    try:
-        rabbitmq_message = aio_pika.Message(
-            body=f"{message.text}|{message.user_alias}".encode(),
-            delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+async def send_message(
+    message: Message,
+    idempotency_key: Optional[str] = Header(default=None)
+):
+    received_ns = time.time_ns()
+    if _key_too_long(idempotency_key):
+        raise HTTPException(
+            status_code=422,
+            detail=f"Idempotency-Key header must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} bytes in UTF-8"
         )
+    admit(1)
+    app.state.in_flight += 1
+    try:
+        body, span = encode(message, received_ns, idempotency_key)
         
-        await app.state.channel.default_exchange.publish(
-            rabbitmq_message,
-            routing_key=FILTER_QUEUE
-        )
+        start_time = time.perf_counter()
+        async with app.state.channel_pool.acquire() as channel:
+            await channel.publish(body, routing_key=FILTER_QUEUE, headers=tracer.forward(span))
+        publish_seconds.observe(time.perf_counter() - start_time)
+        tracer.finish(span)
+        _requests("published").inc()
         
         return {"status": "Message sent successfully"}
     except Exception as e:
+        _requests("error").inc()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        app.state.in_flight -= 1
+
+@app.post("/messages")
+async def send_messages(messages: List[Message]):
+    chunks = [messages[offset:offset + ADMISSION_BATCH_SIZE] for offset in range(0, len(messages), ADMISSION_BATCH_SIZE)]
+    if not chunks:
+        return []
+    admit(len(chunks[0]))
+    slots = asyncio.Semaphore(MAX_BATCHES_IN_FLIGHT)
+    
+    async def publish(index: int, chunk: List[Message]) -> List[dict]:
+        async with slots:
+            return await (publish_batch(chunk) if index == 0 else admit_batch(chunk))
+    
+    batches = await asyncio.gather(*(publish(index, chunk) for index, chunk in enumerate(chunks)))
+    return [result for batch in batches for result in batch]
+
+@app.post("/messages/stream")
+async def stream_messages(request: Request):
+    results = []
+    async for batch in _ndjson_batches(request):
+        messages = [item for item in batch if isinstance(item, Message)]
+        published = iter(await admit_batch(messages))
+        results.extend(next(published) if isinstance(item, Message) else item for item in batch)
+    
+    return Response(
+        "".join(json.dumps(result) + "\n" for result in results),
+        media_type="application/x-ndjson"
+    )
+
+def admit(count: int):
+    if app.state.transport.is_closed:
+        _rejected("unavailable", count)
+        raise HTTPException(
+            status_code=503,
+            detail="RabbitMQ connection is not available",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+        )
+    if app.state.in_flight + count > API_MAX_IN_FLIGHT:
+        _rejected("in_flight", count)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many messages in flight",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+        )
+    retry_after = app.state.queue_monitor.admit(count)
+    if retry_after is not None:
+        _rejected("queue_depth", count)
+        raise HTTPException(
+            status_code=503,
+            detail=f"{FILTER_QUEUE} backlog is above {app.state.queue_monitor.max_depth} messages",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+async def admit_batch(messages: List[Message]) -> List[dict]:
+    try:
+        admit(len(messages))
+    except HTTPException as e:
+        return [{"status": "rejected", "error": e.detail}] * len(messages)
+    return await publish_batch(messages)
+
+def _rejected(reason: str, count: int):
+    registry.counter(
+        'api_rejected_total', 'Messages rejected by admission control', reason=reason
+    ).inc(count)
+
+def encode(message: Message, received_ns: int,
+           idempotency_key: Optional[str] = None) -> Tuple[bytes, Optional[Span]]:
+    sampled = tracer.should_sample()
+    body = encode_message(
+        message.text,
+        message.user_alias,
+        sampled=sampled,
+        idempotency_key=message.idempotency_key or idempotency_key
+    )
+    return body, tracer.ingest(body, received_ns) if sampled else None
+
+async def publish_batch(messages: List[Message]) -> List[dict]:
+    start_time = time.perf_counter()
+    app.state.in_flight += len(messages)
+    try:
+        return await _publish_batch(messages, start_time)
+    finally:
+        app.state.in_flight -= len(messages)
+
+async def _publish_batch(messages: List[Message], start_time: float) -> List[dict]:
+    received_ns = time.time_ns()
+    encoded = [encode(message, received_ns) for message in messages]
+    async with app.state.channel_pool.acquire() as channel:
+        outcomes = await asyncio.gather(*(
+            channel.publish(body, routing_key=FILTER_QUEUE, headers=tracer.forward(span))
+            for body, span in encoded
+        ), return_exceptions=True)
+    
+    results = []
+    for outcome, (_, span) in zip(outcomes, encoded):
+        if isinstance(outcome, Exception):
+            _requests("error").inc()
+            results.append({"status": "error", "error": str(outcome)})
+        else:
+            tracer.finish(span)
+            results.append({"status": "sent"})
+    if messages:
+        publish_seconds.observe((time.perf_counter() - start_time) / len(messages), len(messages))
+    _requests("published").inc(len(results) - sum(result["status"] == "error" for result in results))
+    return results
+
+async def _ndjson_batches(request: Request):
+    batch = []
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                batch.append(_parse_line(line))
+            if len(batch) >= ADMISSION_BATCH_SIZE:
+                yield batch
+                batch = []
+    if buffer.strip():
+        batch.append(_parse_line(buffer))
+    if batch:
+        yield batch
+
+def _parse_line(line: bytes) -> Union[Message, dict]:
+    try:
+        return Message.model_validate_json(line)
+    except ValidationError as e:
+        return {"status": "error", "error": str(e)}
+
+def _requests(status: str):
+    return registry.counter('api_messages_total', 'Messages received by the API by outcome', status=status)
+
+async def _dump_metrics(path: str):
+    while True:
+        registry.dump(path)
+        await asyncio.sleep(API_METRICS_DUMP_INTERVAL)
+
+def _worker_dumps(metrics_dir: str) -> List[str]:
+    paths = []
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        try:
+            os.kill(int(os.path.basename(path)[:-len(".json")]), 0)
+        except ValueError:
+            continue
+        except ProcessLookupError:
+            os.remove(path)
+            continue
+        except PermissionError:
+            pass
+        paths.append(path)
+    return paths
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    if app.state.metrics_path is None:
+        body = registry.render()
+    else:
+        registry.dump(app.state.metrics_path)
+        body = render_records(merge_dumps(_worker_dumps(os.path.dirname(app.state.metrics_path))))
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 async def health_check():
     try:
-        if not app.state.rabbitmq or app.state.rabbitmq.is_closed:
+        if app.state.transport.is_closed:
             raise HTTPException(status_code=503, detail="RabbitMQ connection is not available")
         return {"status": "healthy"}
     except Exception as e:
@@ -56,4 +282,10 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=API_WORKERS,
+        app_dir=os.path.dirname(os.path.abspath(__file__))
+    )
\ No newline at end of file
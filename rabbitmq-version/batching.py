@@ -0,0 +1,87 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from transport import IncomingMessage
+
+class BatchFailed(Exception):
+    def __init__(self, cause: BaseException, remaining: List[IncomingMessage]):
+        super().__init__(str(cause))
+        self.remaining = remaining
+
+async def publish_and_ack(messages: List[IncomingMessage], publishes: List[Tuple[IncomingMessage, Awaitable[None]]]):
+    outcomes = await asyncio.gather(*(publish for _, publish in publishes), return_exceptions=True)
+    failed = {id(message): outcome for (message, _), outcome in zip(publishes, outcomes) if isinstance(outcome, Exception)}
+    try:
+        if not failed:
+            await messages[-1].ack(multiple=True)
+            return
+        for message in messages:
+            if id(message) not in failed:
+                await message.ack()
+    except Exception as e:
+        raise BatchFailed(e, [])
+    raise BatchFailed(next(iter(failed.values())), [message for message in messages if id(message) in failed])
+
+class BatchConsumer:
+    def __init__(
+        self,
+        process_batch: Callable[[List[IncomingMessage]], Awaitable[None]],
+        process_message: Callable[[IncomingMessage], Awaitable[None]],
+        batch_size: int,
+        max_wait_ms: int
+    ):
+        self.process_batch = process_batch
+        self.process_message = process_message
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.pending: asyncio.Queue = asyncio.Queue()
+        self.generation = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def put(self, message: IncomingMessage):
+        await self.pending.put((self.generation, message))
+
+    def reset(self):
+        self.generation += 1
+        while not self.pending.empty():
+            self.pending.get_nowait()
+
+    def start(self) -> asyncio.Task:
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def run(self):
+        while True:
+            batch = [message for generation, message in await self.next_batch() if generation == self.generation]
+            if not batch:
+                continue
+            try:
+                await self.process_batch(batch)
+            except Exception as e:
+                remaining = e.remaining if isinstance(e, BatchFailed) else batch
+                print(f"Batch of {len(batch)} failed ({str(e)}), processing {len(remaining)} messages one by one")
+                for message in remaining:
+                    try:
+                        await self.process_message(message)
+                    except Exception as e:
+                        print(f"Failed to process message: {str(e)}")
+
+    async def next_batch(self) -> List[Tuple[int, IncomingMessage]]:
+        batch = [await self.pending.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.batch_size:
+            if not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.pending.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
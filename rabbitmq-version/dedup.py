@@ -0,0 +1,82 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, OrderedDict
+
+class DedupStore:
+    def __init__(self, ttl_seconds: float, max_entries: int, db_path: Optional[str] = None,
+                 prune_interval: float = 60.0):
+        self.ttl = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.prune_interval = prune_interval
+        self.pruned_at = 0.0
+        self.delivered: OrderedDict[str, float] = OrderedDict()
+        self.in_progress: Dict[str, float] = {}
+        self.db: Optional[sqlite3.Connection] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        if db_path:
+            self._open(db_path)
+
+    def claim(self, key: str) -> bool:
+        now = time.time()
+        self._expire(now)
+        if key in self.delivered or key in self.in_progress:
+            return False
+        self.in_progress[key] = now
+        return True
+
+    def pending(self, key: str) -> bool:
+        return key in self.in_progress
+
+    async def complete(self, key: str):
+        self.in_progress.pop(key, None)
+        expires_at = time.time() + self.ttl
+        self.delivered[key] = expires_at
+        self.delivered.move_to_end(key)
+        while len(self.delivered) > self.max_entries:
+            self.delivered.popitem(last=False)
+        if self.db is not None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._persist, key, expires_at)
+
+    def release(self, key: str):
+        self.in_progress.pop(key, None)
+
+    def close(self):
+        if self.db is not None:
+            self.executor.shutdown(wait=True)
+            self.db.close()
+            self.db = None
+
+    def _expire(self, now: float):
+        while self.delivered:
+            key, expires_at = next(iter(self.delivered.items()))
+            if expires_at > now:
+                break
+            self.delivered.popitem(last=False)
+
+    def _persist(self, key: str, expires_at: float):
+        self.db.execute("INSERT OR REPLACE INTO delivered (key, expires_at) VALUES (?, ?)", (key, expires_at))
+        now = time.time()
+        if now - self.pruned_at >= self.prune_interval:
+            self._prune(now)
+        self.db.commit()
+
+    def _prune(self, now: float):
+        self.db.execute("DELETE FROM delivered WHERE expires_at <= ?", (now,))
+        self.pruned_at = now
+
+    def _open(self, db_path: str):
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dedup-db")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS delivered (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+        self._prune(time.time())
+        self.db.commit()
+
+        rows = self.db.execute(
+            "SELECT key, expires_at FROM delivered ORDER BY expires_at DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, expires_at in reversed(rows):
+            self.delivered[key] = expires_at
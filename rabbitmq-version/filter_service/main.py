@@ -1,57 +1,99 @@
 import asyncio
-import aio_pika
-import aiormq
 import sys
 import os
+from typing import List
+import time
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import get_rabbitmq_url, FILTER_QUEUE, SCREAMING_QUEUE, STOP_WORDS
+from utils import (
+    get_rabbitmq_url, decode_message, FILTER_QUEUE, SCREAMING_QUEUE, STOP_WORDS,
+    CONSUMER_BATCH_SIZE, CONSUMER_BATCH_MAX_WAIT_MS
+)
+from matcher import StopWordMatcher
+from batching import BatchConsumer, publish_and_ack
+from metrics import ServiceMetrics, serve_metrics
+from transport import AmqpTransport, IncomingMessage, Transport
+from tracing import Tracer
 
-async def process_message(message: aio_pika.IncomingMessage):
+stop_words = StopWordMatcher(STOP_WORDS)
+metrics = ServiceMetrics('filter')
+passed_messages = metrics.messages('passed')
+filtered_messages = metrics.messages('filtered')
+tracer = Tracer('filter', FILTER_QUEUE)
+
+async def process_message(message: IncomingMessage):
+    start_time = time.perf_counter()
+    span = tracer.start(message)
     async with message.process():
-        text, user_alias = message.body.decode().split('|')
-        
-        if any(word.lower() in text.lower() for word in STOP_WORDS):
-            print(f"Message from {user_alias} filtered out due to stop words")
-            return
+        envelope = decode_message(message.body)
+        metrics.observe_lag(envelope.created_at_ns)
         
-        await message.channel.basic_publish(
-            message.body,
-            routing_key=SCREAMING_QUEUE,
-            exchange="",
-            properties=aiormq.spec.Basic.Properties(
-                delivery_mode=2
-            )
+        if stop_words.contains(envelope.text):
+            filtered_messages.inc()
+        else:
+            await message.channel.publish(message.body, routing_key=SCREAMING_QUEUE, headers=tracer.forward(span))
+            passed_messages.inc()
+    tracer.finish(span)
+    metrics.process_seconds.observe(time.perf_counter() - start_time)
+
+async def process_batch(messages: List[IncomingMessage]):
+    start_time = time.perf_counter()
+    spans = [tracer.start(message) for message in messages]
+    envelopes = [decode_message(message.body) for message in messages]
+    for envelope in envelopes:
+        metrics.observe_lag(envelope.created_at_ns)
+    texts = [envelope.text for envelope in envelopes]
+    blocked = stop_words.scan_batch(texts)
+    
+    channel = messages[0].channel
+    passed = [(message, span) for message, span, is_blocked in zip(messages, spans, blocked) if not is_blocked]
+    await publish_and_ack(messages, [
+        (message, channel.publish(message.body, routing_key=SCREAMING_QUEUE, headers=tracer.forward(span)))
+        for message, span in passed
+    ])
+    for span in spans:
+        tracer.finish(span)
+    passed_messages.inc(len(passed))
+    filtered_messages.inc(len(messages) - len(passed))
+    metrics.process_seconds.observe((time.perf_counter() - start_time) / len(messages), len(messages))
+
+async def start(transport: Transport):
+    channel = await transport.channel(publisher_confirms=CONSUMER_BATCH_SIZE > 1)
+    await channel.declare_queue(FILTER_QUEUE)
+    await channel.declare_queue(SCREAMING_QUEUE)
+    
+    if CONSUMER_BATCH_SIZE > 1:
+        await channel.set_qos(prefetch_count=CONSUMER_BATCH_SIZE * 2)
+        consumer = BatchConsumer(
+            process_batch,
+            process_message,
+            CONSUMER_BATCH_SIZE,
+            CONSUMER_BATCH_MAX_WAIT_MS
         )
-        print(f"Message from {user_alias} passed filter")
+        consumer.start()
+        channel.on_reopen(consumer.reset)
+        await channel.consume(FILTER_QUEUE, consumer.put)
+        print(f" [*] Filter batch mode: up to {CONSUMER_BATCH_SIZE} messages "
+              f"or {CONSUMER_BATCH_MAX_WAIT_MS}ms per batch")
+    else:
+        await channel.consume(FILTER_QUEUE, process_message)
+    return channel
 
 async def main():
-    connection = await aio_pika.connect_robust(
-        get_rabbitmq_url(),
-        reconnect_interval=5
-    )
+    transport = AmqpTransport(get_rabbitmq_url(), reconnect_interval=5)
+    await transport.connect()
     
-    async with connection:
-        channel = await connection.channel()
-        
-        filter_queue = await channel.declare_queue(
-            FILTER_QUEUE, 
-            durable=True,
-            auto_delete=False
-        )
-        await channel.declare_queue(
-            SCREAMING_QUEUE, 
-            durable=True,
-            auto_delete=False
-        )
-        
+    try:
+        await start(transport)
+        await serve_metrics()
         print(" [*] Filter Service waiting for messages. To exit press CTRL+C")
-        await filter_queue.consume(process_message)
         
         try:
             await asyncio.Future()
         except asyncio.CancelledError:
             pass
+    finally:
+        await transport.close()
 
 if __name__ == "__main__":
     try:
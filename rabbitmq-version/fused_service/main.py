@@ -0,0 +1,111 @@
+import asyncio
+import sys
+import os
+from typing import List
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import (
+    get_rabbitmq_url, decode_message, FILTER_QUEUE, PUBLISH_QUEUE, STOP_WORDS,
+    CONSUMER_BATCH_SIZE, CONSUMER_BATCH_MAX_WAIT_MS
+)
+from matcher import StopWordMatcher
+from batching import BatchConsumer, publish_and_ack
+from metrics import ServiceMetrics, serve_metrics
+from transport import AmqpTransport, IncomingMessage, Transport
+from tracing import Tracer
+
+stop_words = StopWordMatcher(STOP_WORDS)
+metrics = ServiceMetrics('fused')
+converted_messages = metrics.messages('converted')
+filtered_messages = metrics.messages('filtered')
+tracer = Tracer('fused', FILTER_QUEUE)
+
+async def process_message(message: IncomingMessage):
+    start_time = time.perf_counter()
+    span = tracer.start(message)
+    async with message.process():
+        envelope = decode_message(message.body)
+        metrics.observe_lag(envelope.created_at_ns)
+        text = envelope.text
+
+        if stop_words.contains(text):
+            filtered_messages.inc()
+        else:
+            await message.channel.publish(
+                envelope.with_text(text.upper()),
+                routing_key=PUBLISH_QUEUE,
+                headers=tracer.forward(span)
+            )
+            converted_messages.inc()
+    tracer.finish(span)
+    metrics.process_seconds.observe(time.perf_counter() - start_time)
+
+async def process_batch(messages: List[IncomingMessage]):
+    start_time = time.perf_counter()
+    spans = [tracer.start(message) for message in messages]
+    envelopes = [decode_message(message.body) for message in messages]
+    for envelope in envelopes:
+        metrics.observe_lag(envelope.created_at_ns)
+    texts = [envelope.text for envelope in envelopes]
+    blocked = stop_words.scan_batch(texts)
+    bodies = [
+        (message, envelope.with_text(text.upper()), span)
+        for message, envelope, text, span, is_blocked in zip(messages, envelopes, texts, spans, blocked)
+        if not is_blocked
+    ]
+
+    channel = messages[0].channel
+    await publish_and_ack(messages, [
+        (message, channel.publish(body, routing_key=PUBLISH_QUEUE, headers=tracer.forward(span)))
+        for message, body, span in bodies
+    ])
+    for span in spans:
+        tracer.finish(span)
+    converted_messages.inc(len(bodies))
+    filtered_messages.inc(len(messages) - len(bodies))
+    metrics.process_seconds.observe((time.perf_counter() - start_time) / len(messages), len(messages))
+
+async def start(transport: Transport):
+    channel = await transport.channel(publisher_confirms=CONSUMER_BATCH_SIZE > 1)
+    await channel.declare_queue(FILTER_QUEUE)
+    await channel.declare_queue(PUBLISH_QUEUE)
+
+    if CONSUMER_BATCH_SIZE > 1:
+        await channel.set_qos(prefetch_count=CONSUMER_BATCH_SIZE * 2)
+        consumer = BatchConsumer(
+            process_batch,
+            process_message,
+            CONSUMER_BATCH_SIZE,
+            CONSUMER_BATCH_MAX_WAIT_MS
+        )
+        consumer.start()
+        channel.on_reopen(consumer.reset)
+        await channel.consume(FILTER_QUEUE, consumer.put)
+        print(f" [*] Fused batch mode: up to {CONSUMER_BATCH_SIZE} messages "
+              f"or {CONSUMER_BATCH_MAX_WAIT_MS}ms per batch")
+    else:
+        await channel.consume(FILTER_QUEUE, process_message)
+    return channel
+
+async def main():
+    transport = AmqpTransport(get_rabbitmq_url(), reconnect_interval=5)
+    await transport.connect()
+
+    try:
+        await start(transport)
+        await serve_metrics()
+        print(" [*] Fused Filter+SCREAMING Service waiting for messages. To exit press CTRL+C")
+
+        try:
+            await asyncio.Future()
+        except asyncio.CancelledError:
+            pass
+    finally:
+        await transport.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nShutting down...")
\ No newline at end of file
@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+import importlib.util
+import os
+import sys
+
+import uvicorn
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SERVICES_DIR)
+from metrics import serve_metrics
+from transport import MemoryTransport
+
+def load_service(name: str):
+    path = os.path.join(SERVICES_DIR, f"{name}_service", "main.py")
+    spec = importlib.util.spec_from_file_location(f"{name}_service", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+async def main(fused: bool, port: int):
+    transport = MemoryTransport()
+    await transport.connect()
+
+    stages = ["fused"] if fused else ["filter", "screaming"]
+    for name in stages:
+        await load_service(name).start(transport)
+    publish_service = load_service("publish")
+    await publish_service.start(transport)
+
+    api_service = load_service("api")
+    api_service.app.state.transport = transport
+    server = uvicorn.Server(uvicorn.Config(api_service.app, host="0.0.0.0", port=port))
+
+    await serve_metrics()
+    print(f" [*] Local Service running api, {', '.join(stages)} and publish on an in-process broker")
+    try:
+        await server.serve()
+    finally:
+        await publish_service.stop()
+        await transport.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the whole topology in one process without RabbitMQ")
+    parser.add_argument("--fused", action="store_true", help="Run the fused filter+screaming stage")
+    parser.add_argument("--port", type=int, default=8000, help="API port")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.fused, args.port))
+    except KeyboardInterrupt:
+        print("\nShutting down...")
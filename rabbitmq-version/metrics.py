@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+from utils import METRICS_PORT
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Dict[str, str]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Dict[str, str]):
+        super().__init__(name, help, labels)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def samples(self):
+        return [(self.name, self.labels, self.value)]
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float):
+        self.value = value
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Dict[str, str], buckets: Tuple[float, ...]):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, count: int = 1):
+        self.counts[bisect_left(self.buckets, value)] += count
+        self.sum += value * count
+        self.count += count
+
+    def samples(self):
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append((f'{self.name}_bucket', {**self.labels, 'le': le}, cumulative))
+        samples.append((f'{self.name}_sum', self.labels, self.sum))
+        samples.append((f'{self.name}_count', self.labels, self.count))
+        return samples
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[tuple, Metric] = {}
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        return self._get_or_create(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, **labels: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+                  **labels: str) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labels, buckets)
+
+    def _get_or_create(self, metric_cls: type, name: str, help: str, labels: dict, *args):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            metric = metric_cls(name, help, labels, *args)
+            self.metrics[key] = metric
+        elif not isinstance(metric, metric_cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+        return metric
+
+    def records(self) -> List[dict]:
+        return [
+            {'name': metric.name, 'help': metric.help, 'type': metric.type, 'samples': metric.samples()}
+            for metric in self.metrics.values()
+        ]
+
+    def render(self) -> str:
+        return render_records(self.records())
+
+    def dump(self, path: str):
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.records(), f)
+        os.replace(temp_path, path)
+
+def merge_dumps(paths: List[str]) -> List[dict]:
+    merged: Dict[str, dict] = {}
+    for path in paths:
+        try:
+            with open(path) as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for record in records:
+            metric = merged.setdefault(record['name'], {**record, 'samples': {}})
+            for name, labels, value in record['samples']:
+                key = (name, tuple(labels.items()))
+                metric['samples'][key] = metric['samples'].get(key, 0) + value
+    return [
+        {**metric, 'samples': [(name, dict(labels), value) for (name, labels), value in metric['samples'].items()]}
+        for metric in merged.values()
+    ]
+
+def render_records(records: List[dict]) -> str:
+    lines = []
+    described = set()
+    for record in sorted(records, key=lambda r: r['name']):
+        if record['name'] not in described:
+            described.add(record['name'])
+            lines.append(f"# HELP {record['name']} {record['help']}")
+            lines.append(f"# TYPE {record['name']} {record['type']}")
+        for name, labels, value in record['samples']:
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+class ServiceMetrics:
+    def __init__(self, service: str):
+        self.service = service
+        self.process_seconds = registry.histogram(
+            'service_process_seconds', 'Per-message processing time of a service', service=service)
+        self.lag = registry.histogram(
+            'service_lag_seconds', 'Time from message creation until a service received it', service=service)
+
+    def messages(self, result: str) -> Counter:
+        return registry.counter(
+            'service_messages_total', 'Messages handled by a service by outcome',
+            service=self.service, result=result)
+
+    def observe_lag(self, created_at_ns: int):
+        if created_at_ns:
+            self.lag.observe(max(0, time.time_ns() - created_at_ns) / 1e9)
+
+async def serve_metrics(port: int = METRICS_PORT):
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle_scrape, host='0.0.0.0', port=port)
+    print(f" [*] Metrics available on :{port}/metrics")
+    return server
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        await reader.readuntil(b'\r\n\r\n')
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[1].split(b'?')[0] == b'/metrics':
+            status, body = b'200 OK', registry.render().encode()
+        else:
+            status, body = b'404 Not Found', b'Not Found\n'
+        writer.write(
+            b'HTTP/1.1 ' + status + b'\r\n'
+            b'Content-Type: text/plain; version=0.0.4\r\n'
+            b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+            b'Connection: close\r\n\r\n' + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + '}'
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
@@ -1,15 +1,29 @@
 import asyncio
-import aio_pika
 import yagmail
+import threading
 import sys
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import (
-    get_rabbitmq_url, PUBLISH_QUEUE,
-    EMAIL_SENDER, EMAIL_PASSWORD, EMAIL_RECIPIENTS
+    get_rabbitmq_url, decode_message, PUBLISH_QUEUE,
+    EMAIL_SENDER, EMAIL_PASSWORD, EMAIL_RECIPIENTS, EMAIL_SEND_CONCURRENCY,
+    EMAIL_DIGEST_ENABLED, EMAIL_DIGEST_MAX_MESSAGES, EMAIL_DIGEST_MAX_WAIT_MS,
+    EMAIL_DIGEST_BY_ALIAS, DEDUP_ENABLED, DEDUP_TTL_SECONDS, DEDUP_MAX_ENTRIES, DEDUP_DB_PATH,
+    DEDUP_PRUNE_INTERVAL, DEDUP_REQUEUE_DELAY_MS
 )
+from metrics import ServiceMetrics, registry, serve_metrics
+from dedup import DedupStore
+from transport import AmqpTransport, IncomingMessage, Transport
+from tracing import Span, Tracer
+
+metrics = ServiceMetrics('publish')
+email_send_seconds = registry.histogram('email_send_seconds', 'Time spent sending one email')
+email_failures = registry.counter('email_send_failures_total', 'Real email sends that failed and fell back to simulation')
+tracer = Tracer('publish', PUBLISH_QUEUE)
 
 email_client = None
 if all([EMAIL_SENDER, EMAIL_PASSWORD, EMAIL_RECIPIENTS]):
@@ -19,6 +33,28 @@ if all([EMAIL_SENDER, EMAIL_PASSWORD, EMAIL_RECIPIENTS]):
     except Exception as e:
         print(f"Failed to initialize email client: {str(e)}")
 
+email_executor = ThreadPoolExecutor(
+    max_workers=EMAIL_SEND_CONCURRENCY,
+    thread_name_prefix="email-sender"
+)
+email_thread_state = threading.local()
+
+def send_email_blocking(subject: str, body: str, recipients: list):
+    client = getattr(email_thread_state, 'client', None)
+    if client is None:
+        client = yagmail.SMTP(EMAIL_SENDER, EMAIL_PASSWORD)
+        email_thread_state.client = client
+    
+    try:
+        client.send(
+            to=recipients,
+            subject=subject,
+            contents=body
+        )
+    except Exception:
+        email_thread_state.client = None
+        raise
+
 async def simulate_email_send(subject: str, body: str, recipients: list):
     await asyncio.sleep(0.1 + (time.time() % 0.1))
     print(f"[SIMULATED] Email sent:")
@@ -27,50 +63,230 @@ async def simulate_email_send(subject: str, body: str, recipients: list):
     print(f"Body: {body}\n")
 
 async def send_email(subject: str, body: str, recipients: list):
+    start_time = time.perf_counter()
+    try:
+        return await _send_email(subject, body, recipients)
+    finally:
+        email_send_seconds.observe(time.perf_counter() - start_time)
+
+async def _send_email(subject: str, body: str, recipients: list):
     if email_client is not None:
         try:
-            email_client.send(
-                to=recipients,
-                subject=subject,
-                contents=body
+            await asyncio.get_running_loop().run_in_executor(
+                email_executor,
+                send_email_blocking,
+                subject,
+                body,
+                recipients
             )
-            print(f"Real email sent to {', '.join(recipients)}")
             return True
         except Exception as e:
             print(f"Failed to send real email: {str(e)}")
+            email_failures.inc()
             await simulate_email_send(subject, body, recipients)
             return False
     else:
         await simulate_email_send(subject, body, recipients)
         return False
 
-async def process_message(message: aio_pika.IncomingMessage):
+class DigestBatcher:
+    def __init__(self, max_messages: int, max_wait_ms: int, group_by_alias: bool):
+        self.max_messages = max(1, max_messages)
+        self.max_wait = max_wait_ms / 1000
+        self.group_by_alias = group_by_alias
+        self.groups: Dict[tuple, list] = {}
+        self.timers: Dict[tuple, asyncio.TimerHandle] = {}
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def add(self, message: IncomingMessage, text: str, user_alias: str, recipients: list,
+                  dedup_key: Optional[str] = None, span: Optional[Span] = None):
+        key = (tuple(recipients), user_alias if self.group_by_alias else None)
+        entries = self.groups.setdefault(key, [])
+        entries.append((message, text, user_alias, dedup_key, span))
+        
+        if len(entries) >= self.max_messages:
+            await self.flush(key)
+        elif len(entries) == 1:
+            self.timers[key] = asyncio.get_running_loop().call_later(
+                self.max_wait, self._flush_later, key
+            )
+
+    def _flush_later(self, key: tuple):
+        task = asyncio.create_task(self.flush(key))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def flush(self, key: tuple):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        entries = self.groups.pop(key, None)
+        if not entries:
+            return
+        
+        recipients, user_alias = key
+        if user_alias is not None:
+            subject = f"{len(entries)} New Messages from {user_alias}"
+        else:
+            subject = f"{len(entries)} New Messages"
+        body = "\n".join(f"{alias}: {text}" for _, text, alias, _, _ in entries)
+        
+        try:
+            success = await send_email(subject, body, list(recipients))
+        except BaseException:
+            for _, _, _, dedup_key, _ in entries:
+                release_duplicate(dedup_key)
+            for message, _, _, _, _ in entries:
+                try:
+                    await message.reject(requeue=True)
+                except Exception as e:
+                    print(f"Failed to requeue digest message: {str(e)}")
+            raise
+        for message, _, _, dedup_key, span in entries:
+            await complete_duplicate(dedup_key)
+            await message.ack()
+            tracer.finish(span)
+        
+        metrics.messages("sent" if success else "simulated").inc(len(entries))
+
+    async def flush_all(self):
+        for key in list(self.groups):
+            await self.flush(key)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+class DuplicateMessage(Exception):
+    pass
+
+class DuplicateInProgress(DuplicateMessage):
+    pass
+
+dedup = DedupStore(
+    DEDUP_TTL_SECONDS, DEDUP_MAX_ENTRIES, DEDUP_DB_PATH or None, DEDUP_PRUNE_INTERVAL
+) if DEDUP_ENABLED else None
+
+def claim_duplicate(envelope) -> Optional[str]:
+    if dedup is None:
+        return None
+    key = envelope.dedup_key
+    if not dedup.claim(key):
+        raise DuplicateInProgress(key) if dedup.pending(key) else DuplicateMessage(key)
+    return key
+
+async def requeue_duplicate(message: IncomingMessage):
+    await asyncio.sleep(DEDUP_REQUEUE_DELAY_MS / 1000)
+    await message.reject(requeue=True)
+    metrics.messages("requeued").inc()
+
+async def complete_duplicate(key: Optional[str]):
+    if key is not None:
+        await dedup.complete(key)
+
+def release_duplicate(key: Optional[str]):
+    if key is not None:
+        dedup.release(key)
+
+digest = DigestBatcher(
+    EMAIL_DIGEST_MAX_MESSAGES,
+    EMAIL_DIGEST_MAX_WAIT_MS,
+    EMAIL_DIGEST_BY_ALIAS
+) if EMAIL_DIGEST_ENABLED else None
+
+async def process_message(message: IncomingMessage):
+    span = tracer.start(message)
+    if digest is not None:
+        try:
+            envelope = decode_message(message.body)
+            text, user_alias = envelope.text, envelope.user_alias
+        except ValueError:
+            await message.reject()
+            metrics.messages("rejected").inc()
+            return
+        metrics.observe_lag(envelope.created_at_ns)
+        try:
+            dedup_key = claim_duplicate(envelope)
+        except DuplicateInProgress:
+            await requeue_duplicate(message)
+            return
+        except DuplicateMessage:
+            await message.ack()
+            metrics.messages("duplicate").inc()
+            return
+        await digest.add(message, text, user_alias, EMAIL_RECIPIENTS, dedup_key, span)
+        return
+    
+    start_time = time.perf_counter()
     async with message.process():
-        text, user_alias = message.body.decode().split('|')
+        envelope = decode_message(message.body)
+        metrics.observe_lag(envelope.created_at_ns)
+        text, user_alias = envelope.text, envelope.user_alias
+        
+        try:
+            dedup_key = claim_duplicate(envelope)
+        except DuplicateInProgress:
+            await requeue_duplicate(message)
+            return
+        except DuplicateMessage:
+            metrics.messages("duplicate").inc()
+            return
         
         subject = f"New Message from {user_alias}"
         body = f"Message: {text}"
         
-        success = await send_email(subject, body, EMAIL_RECIPIENTS)
-        status = "sent" if success else "simulated"
-        print(f"Email {status} for message from {user_alias}")
+        try:
+            success = await send_email(subject, body, EMAIL_RECIPIENTS)
+        except BaseException:
+            release_duplicate(dedup_key)
+            raise
+        await complete_duplicate(dedup_key)
+        metrics.messages("sent" if success else "simulated").inc()
+    tracer.finish(span)
+    metrics.process_seconds.observe(time.perf_counter() - start_time)
+
+async def start(transport: Transport):
+    channel = await transport.channel()
+    prefetch_count = EMAIL_SEND_CONCURRENCY
+    if digest is not None:
+        prefetch_count *= digest.max_messages
+    await channel.set_qos(prefetch_count=prefetch_count)
+    await channel.declare_queue(PUBLISH_QUEUE)
+    
+    print(" [*] Email mode:", "REAL" if email_client else "SIMULATION")
+    print(" [*] Concurrent email sends:", EMAIL_SEND_CONCURRENCY)
+    if dedup is not None:
+        print(f" [*] Duplicate suppression: {DEDUP_TTL_SECONDS:.0f}s window, "
+              f"{'persisted to ' + DEDUP_DB_PATH if DEDUP_DB_PATH else 'in memory'}")
+    if digest is not None:
+        print(f" [*] Digest mode: up to {digest.max_messages} messages "
+              f"or {EMAIL_DIGEST_MAX_WAIT_MS}ms per email")
+    await channel.consume(PUBLISH_QUEUE, process_message)
+    return channel
+
+async def stop():
+    if digest is not None:
+        await digest.flush_all()
+    if dedup is not None:
+        dedup.close()
+    email_executor.shutdown(wait=False)
+    tracer.close()
 
 async def main():
-    connection = await aio_pika.connect_robust(get_rabbitmq_url())
+    transport = AmqpTransport(get_rabbitmq_url())
+    await transport.connect()
     
-    async with connection:
-        channel = await connection.channel()
-        
-        publish_queue = await channel.declare_queue(PUBLISH_QUEUE, durable=True)
-        
+    try:
+        await start(transport)
+        await serve_metrics()
         print(" [*] Publish Service waiting for messages. To exit press CTRL+C")
-        print(" [*] Email mode:", "REAL" if email_client else "SIMULATION")
-        await publish_queue.consume(process_message)
         
         try:
             await asyncio.Future()
         except asyncio.CancelledError:
             pass
+        finally:
+            await stop()
+    finally:
+        await transport.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,55 +1,95 @@
 import asyncio
-import aio_pika
-import aiormq
 import sys
 import os
+from typing import List
+import time
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import get_rabbitmq_url, SCREAMING_QUEUE, PUBLISH_QUEUE
+from utils import (
+    get_rabbitmq_url, decode_message, SCREAMING_QUEUE, PUBLISH_QUEUE,
+    CONSUMER_BATCH_SIZE, CONSUMER_BATCH_MAX_WAIT_MS
+)
+from batching import BatchConsumer, publish_and_ack
+from metrics import ServiceMetrics, serve_metrics
+from transport import AmqpTransport, IncomingMessage, Transport
+from tracing import Tracer
 
-async def process_message(message: aio_pika.IncomingMessage):
+metrics = ServiceMetrics('screaming')
+converted_messages = metrics.messages('converted')
+tracer = Tracer('screaming', SCREAMING_QUEUE)
+
+async def process_message(message: IncomingMessage):
+    start_time = time.perf_counter()
+    span = tracer.start(message)
     async with message.process():
-        text, user_alias = message.body.decode().split('|')
-        
-        screamed_text = text.upper()
+        envelope = decode_message(message.body)
+        metrics.observe_lag(envelope.created_at_ns)
         
-        await message.channel.basic_publish(
-            f"{screamed_text}|{user_alias}".encode(),
+        await message.channel.publish(
+            envelope.with_text(envelope.text.upper()),
             routing_key=PUBLISH_QUEUE,
-            exchange="",
-            properties=aiormq.spec.Basic.Properties(
-                delivery_mode=2
-            )
+            headers=tracer.forward(span)
         )
-        print(f"Converted message from {user_alias} to uppercase")
+        converted_messages.inc()
+    tracer.finish(span)
+    metrics.process_seconds.observe(time.perf_counter() - start_time)
 
-async def main():
-    connection = await aio_pika.connect_robust(
-        get_rabbitmq_url(),
-        reconnect_interval=5
-    )
+async def process_batch(messages: List[IncomingMessage]):
+    start_time = time.perf_counter()
+    spans = [tracer.start(message) for message in messages]
+    bodies = []
+    for message in messages:
+        envelope = decode_message(message.body)
+        metrics.observe_lag(envelope.created_at_ns)
+        bodies.append(envelope.with_text(envelope.text.upper()))
     
-    async with connection:
-        channel = await connection.channel()
-        
-        screaming_queue = await channel.declare_queue(
-            SCREAMING_QUEUE, 
-            durable=True,
-            auto_delete=False
-        )
-        await channel.declare_queue(
-            PUBLISH_QUEUE, 
-            durable=True,
-            auto_delete=False
+    channel = messages[0].channel
+    await publish_and_ack(messages, [
+        (message, channel.publish(body, routing_key=PUBLISH_QUEUE, headers=tracer.forward(span)))
+        for message, body, span in zip(messages, bodies, spans)
+    ])
+    for span in spans:
+        tracer.finish(span)
+    converted_messages.inc(len(messages))
+    metrics.process_seconds.observe((time.perf_counter() - start_time) / len(messages), len(messages))
+
+async def start(transport: Transport):
+    channel = await transport.channel(publisher_confirms=CONSUMER_BATCH_SIZE > 1)
+    await channel.declare_queue(SCREAMING_QUEUE)
+    await channel.declare_queue(PUBLISH_QUEUE)
+    
+    if CONSUMER_BATCH_SIZE > 1:
+        await channel.set_qos(prefetch_count=CONSUMER_BATCH_SIZE * 2)
+        consumer = BatchConsumer(
+            process_batch,
+            process_message,
+            CONSUMER_BATCH_SIZE,
+            CONSUMER_BATCH_MAX_WAIT_MS
         )
-        
+        consumer.start()
+        channel.on_reopen(consumer.reset)
+        await channel.consume(SCREAMING_QUEUE, consumer.put)
+        print(f" [*] SCREAMING batch mode: up to {CONSUMER_BATCH_SIZE} messages "
+              f"or {CONSUMER_BATCH_MAX_WAIT_MS}ms per batch")
+    else:
+        await channel.consume(SCREAMING_QUEUE, process_message)
+    return channel
+
+async def main():
+    transport = AmqpTransport(get_rabbitmq_url(), reconnect_interval=5)
+    await transport.connect()
+    
+    try:
+        await start(transport)
+        await serve_metrics()
         print(" [*] SCREAMING Service waiting for messages. To exit press CTRL+C")
-        await screaming_queue.consume(process_message)
         
         try:
             await asyncio.Future()
         except asyncio.CancelledError:
             pass
+    finally:
+        await transport.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,100 @@
+import json
+import os
+import random
+import time
+from typing import List, Optional
+
+from utils import Envelope, TRACE_LOG_DIR, TRACE_SAMPLE_RATE
+from transport import Headers, IncomingMessage
+
+MESSAGE_ID_HEADER = 'x-message-id'
+INGEST_HEADER = 'x-ingest-ns'
+ENQUEUED_HEADER = 'x-enqueued-ns'
+HOPS_HEADER = 'x-hops'
+
+class Span:
+    __slots__ = ('service', 'queue', 'message_id', 'ingest_ns', 'enqueued_ns', 'dequeued_ns', 'done_ns', 'hops')
+
+    def __init__(self, service: str, queue: str, message_id: str, ingest_ns: int, enqueued_ns: int,
+                 dequeued_ns: int, hops: List[str]):
+        self.service = service
+        self.queue = queue
+        self.message_id = message_id
+        self.ingest_ns = ingest_ns
+        self.enqueued_ns = enqueued_ns
+        self.dequeued_ns = dequeued_ns
+        self.done_ns: Optional[int] = None
+        self.hops = hops
+
+    def hop(self, done_ns: int) -> str:
+        return f'{self.service}:{self.enqueued_ns}:{self.dequeued_ns}:{done_ns}'
+
+    def record(self) -> dict:
+        return {
+            'trace_id': self.message_id,
+            'service': self.service,
+            'queue': self.queue,
+            'ingest_ns': self.ingest_ns,
+            'enqueued_ns': self.enqueued_ns,
+            'dequeued_ns': self.dequeued_ns,
+            'done_ns': self.done_ns,
+            'hops': self.hops,
+        }
+
+class Tracer:
+    def __init__(self, service: str, queue: str = '', log_dir: str = TRACE_LOG_DIR,
+                 sample_rate: float = TRACE_SAMPLE_RATE):
+        self.service = service
+        self.queue = queue
+        self.sample_rate = sample_rate
+        self.log = None
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            self.log = open(os.path.join(log_dir, f'{service}.jsonl'), 'a', buffering=1)
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def ingest(self, body: bytes, received_ns: int) -> Span:
+        envelope = Envelope(body)
+        return Span(self.service, self.queue, envelope.message_id, envelope.created_at_ns, received_ns, received_ns, [])
+
+    def start(self, message: IncomingMessage) -> Optional[Span]:
+        headers = message.headers
+        if not headers or MESSAGE_ID_HEADER not in headers:
+            return None
+        return Span(
+            self.service,
+            self.queue,
+            _text(headers[MESSAGE_ID_HEADER]),
+            headers.get(INGEST_HEADER, 0),
+            headers.get(ENQUEUED_HEADER, 0),
+            time.time_ns(),
+            [_text(hop) for hop in headers.get(HOPS_HEADER, ())]
+        )
+
+    def forward(self, span: Optional[Span]) -> Optional[Headers]:
+        if span is None:
+            return None
+        now = time.time_ns()
+        return {
+            MESSAGE_ID_HEADER: span.message_id,
+            INGEST_HEADER: span.ingest_ns,
+            ENQUEUED_HEADER: now,
+            HOPS_HEADER: span.hops + [span.hop(now)],
+        }
+
+    def finish(self, span: Optional[Span]):
+        if span is None:
+            return
+        span.done_ns = time.time_ns()
+        if self.log is not None:
+            self.log.write(json.dumps(span.record()) + '\n')
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
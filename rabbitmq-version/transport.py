@@ -0,0 +1,332 @@
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import aio_pika
+import aiormq
+
+PERSISTENT = aiormq.spec.Basic.Properties(delivery_mode=2)
+
+Headers = Dict[str, Any]
+
+class IncomingMessage(ABC):
+    body: bytes
+    headers: Optional[Headers]
+    channel: 'Channel'
+
+    @abstractmethod
+    def process(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def ack(self, multiple: bool = False):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def reject(self, requeue: bool = False):
+        raise NotImplementedError
+
+Callback = Callable[[IncomingMessage], Awaitable[None]]
+
+class Channel(ABC):
+    @abstractmethod
+    async def declare_queue(self, name: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_qos(self, prefetch_count: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def consume(self, queue_name: str, callback: Callback):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def publish(self, body: bytes, routing_key: str, headers: Optional[Headers] = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def queue_depth(self, queue_name: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def on_reopen(self, callback: Callable[[], None]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self):
+        raise NotImplementedError
+
+class Transport(ABC):
+    @property
+    @abstractmethod
+    def is_closed(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def connect(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def channel(self, publisher_confirms: bool = False) -> Channel:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self):
+        raise NotImplementedError
+
+class AmqpMessage(IncomingMessage):
+    __slots__ = ('message', 'channel', 'body')
+
+    @property
+    def headers(self) -> Optional[Headers]:
+        return self.message.headers
+
+    def __init__(self, message: aio_pika.abc.AbstractIncomingMessage, channel: 'AmqpChannel'):
+        self.message = message
+        self.channel = channel
+        self.body = message.body
+
+    def process(self):
+        return self.message.process(ignore_processed=True)
+
+    async def ack(self, multiple: bool = False):
+        await self.message.ack(multiple=multiple)
+
+    async def reject(self, requeue: bool = False):
+        await self.message.reject(requeue=requeue)
+
+class AmqpChannel(Channel):
+    def __init__(self, channel: aio_pika.abc.AbstractChannel):
+        self.channel = channel
+        self.queues: Dict[str, aio_pika.abc.AbstractQueue] = {}
+
+    async def declare_queue(self, name: str):
+        self.queues[name] = await self.channel.declare_queue(name, durable=True, auto_delete=False)
+
+    async def set_qos(self, prefetch_count: int):
+        await self.channel.set_qos(prefetch_count=prefetch_count)
+
+    def on_reopen(self, callback: Callable[[], None]):
+        self.channel.reopen_callbacks.add(lambda channel: callback())
+
+    async def consume(self, queue_name: str, callback: Callback):
+        if queue_name not in self.queues:
+            await self.declare_queue(queue_name)
+
+        async def on_message(message: aio_pika.abc.AbstractIncomingMessage):
+            await callback(AmqpMessage(message, self))
+
+        await self.queues[queue_name].consume(on_message)
+
+    async def publish(self, body: bytes, routing_key: str, headers: Optional[Headers] = None):
+        properties = aiormq.spec.Basic.Properties(delivery_mode=2, headers=headers) if headers else PERSISTENT
+        channel = await self.channel.get_underlay_channel()
+        await channel.basic_publish(body, routing_key=routing_key, exchange="", properties=properties)
+
+    async def queue_depth(self, queue_name: str) -> int:
+        queue = await self.channel.declare_queue(queue_name, durable=True, passive=True)
+        return queue.declaration_result.message_count
+
+    async def close(self):
+        await self.channel.close()
+
+class AmqpTransport(Transport):
+    def __init__(self, url: str, reconnect_interval: float = 5):
+        self.url = url
+        self.reconnect_interval = reconnect_interval
+        self.connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+
+    @property
+    def is_closed(self) -> bool:
+        return self.connection is None or self.connection.is_closed
+
+    async def connect(self):
+        self.connection = await aio_pika.connect_robust(self.url, reconnect_interval=self.reconnect_interval)
+
+    async def channel(self, publisher_confirms: bool = False) -> AmqpChannel:
+        return AmqpChannel(await self.connection.channel(publisher_confirms=publisher_confirms))
+
+    async def close(self):
+        if self.connection is not None:
+            await self.connection.close()
+
+class MessageProcessError(Exception):
+    pass
+
+class MemoryMessage(IncomingMessage):
+    __slots__ = ('body', 'headers', 'channel', 'queue', 'delivery_tag', 'redelivered', 'processed')
+
+    def __init__(self, body: bytes, headers: Optional[Headers], channel: 'MemoryChannel', queue: 'MemoryQueue',
+                 delivery_tag: int, redelivered: bool):
+        self.body = body
+        self.headers = headers
+        self.channel = channel
+        self.queue = queue
+        self.delivery_tag = delivery_tag
+        self.redelivered = redelivered
+        self.processed = False
+
+    @asynccontextmanager
+    async def process(self):
+        try:
+            yield self
+        except BaseException:
+            if not self.processed:
+                await self.reject()
+            raise
+        else:
+            if not self.processed:
+                await self.ack()
+
+    async def ack(self, multiple: bool = False):
+        self._settle()
+        self.channel.settle(self.delivery_tag, multiple)
+
+    async def reject(self, requeue: bool = False):
+        self._settle()
+        if requeue:
+            self.queue.ready.appendleft((self.body, self.headers, True))
+        self.channel.settle(self.delivery_tag, False)
+
+    def _settle(self):
+        if self.processed:
+            raise MessageProcessError(f"Message {self.delivery_tag} was already processed")
+        self.processed = True
+
+class MemoryQueue:
+    def __init__(self, name: str):
+        self.name = name
+        self.ready: Deque[Tuple[bytes, Optional[Headers], bool]] = deque()
+        self.consumers: List[Tuple['MemoryChannel', Callback]] = []
+        self.next_consumer = 0
+
+    def put(self, body: bytes, headers: Optional[Headers] = None, redelivered: bool = False, front: bool = False):
+        if front:
+            self.ready.appendleft((body, headers, redelivered))
+        else:
+            self.ready.append((body, headers, redelivered))
+        self.dispatch()
+
+    def dispatch(self):
+        while self.ready and self.consumers:
+            for offset in range(len(self.consumers)):
+                index = (self.next_consumer + offset) % len(self.consumers)
+                channel, callback = self.consumers[index]
+                if channel.has_credit():
+                    break
+            else:
+                return
+            self.next_consumer = index + 1
+            body, headers, redelivered = self.ready.popleft()
+            channel.deliver(self, body, headers, redelivered, callback)
+
+class MemoryChannel(Channel):
+    def __init__(self, broker: 'MemoryTransport'):
+        self.broker = broker
+        self.prefetch_count = 0
+        self.delivery_tags = itertools.count(1)
+        self.unacked: Dict[int, Tuple[MemoryQueue, bytes, Optional[Headers]]] = {}
+        self.consuming: List[MemoryQueue] = []
+        self.tasks: Set[asyncio.Task] = set()
+        self.is_closed = False
+
+    async def declare_queue(self, name: str):
+        self.broker.queue(name)
+
+    async def set_qos(self, prefetch_count: int):
+        self.prefetch_count = prefetch_count
+        self._dispatch()
+
+    async def consume(self, queue_name: str, callback: Callback):
+        queue = self.broker.queue(queue_name)
+        queue.consumers.append((self, callback))
+        self.consuming.append(queue)
+        queue.dispatch()
+
+    async def publish(self, body: bytes, routing_key: str, headers: Optional[Headers] = None):
+        if self.is_closed:
+            raise aiormq.exceptions.ChannelInvalidStateError("Channel is closed")
+        queue = self.broker.queues.get(routing_key)
+        if queue is not None:
+            queue.put(body, headers)
+
+    async def queue_depth(self, queue_name: str) -> int:
+        return len(self.broker.queue(queue_name).ready)
+
+    def on_reopen(self, callback: Callable[[], None]):
+        pass
+
+    async def close(self):
+        if self.is_closed:
+            return
+        self.is_closed = True
+        for queue in self.consuming:
+            queue.consumers = [consumer for consumer in queue.consumers if consumer[0] is not self]
+        unacked = list(self.unacked.values())
+        self.unacked.clear()
+        for queue, body, headers in reversed(unacked):
+            queue.put(body, headers, redelivered=True, front=True)
+        for task in list(self.tasks):
+            task.cancel()
+
+    def has_credit(self) -> bool:
+        return not self.prefetch_count or len(self.unacked) < self.prefetch_count
+
+    def deliver(self, queue: MemoryQueue, body: bytes, headers: Optional[Headers], redelivered: bool,
+                callback: Callback):
+        delivery_tag = next(self.delivery_tags)
+        self.unacked[delivery_tag] = (queue, body, headers)
+        task = asyncio.create_task(callback(MemoryMessage(body, headers, self, queue, delivery_tag, redelivered)))
+        self.tasks.add(task)
+        task.add_done_callback(self._on_done)
+
+    def settle(self, delivery_tag: int, multiple: bool):
+        if multiple:
+            for tag in [tag for tag in self.unacked if tag <= delivery_tag]:
+                del self.unacked[tag]
+        else:
+            self.unacked.pop(delivery_tag, None)
+        self._dispatch()
+
+    def _dispatch(self):
+        for queue in self.consuming:
+            queue.dispatch()
+
+    def _on_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Consumer callback failed: {str(task.exception())}")
+
+class MemoryTransport(Transport):
+    def __init__(self):
+        self.queues: Dict[str, MemoryQueue] = {}
+        self.channels: List[MemoryChannel] = []
+        self.closed = True
+
+    @property
+    def is_closed(self) -> bool:
+        return self.closed
+
+    async def connect(self):
+        self.closed = False
+
+    async def channel(self, publisher_confirms: bool = False) -> MemoryChannel:
+        channel = MemoryChannel(self)
+        self.channels.append(channel)
+        return channel
+
+    def queue(self, name: str) -> MemoryQueue:
+        queue = self.queues.get(name)
+        if queue is None:
+            queue = self.queues[name] = MemoryQueue(name)
+        return queue
+
+    async def close(self):
+        for channel in self.channels:
+            await channel.close()
+        self.channels.clear()
+        self.closed = True
@@ -1,5 +1,8 @@
 import os
-from typing import List
+import random
+import struct
+import time
+from typing import List, Optional, Tuple
 
 RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'localhost')
 RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT', 5672))
@@ -10,11 +13,174 @@ FILTER_QUEUE = 'filter_queue'
 SCREAMING_QUEUE = 'screaming_queue'
 PUBLISH_QUEUE = 'publish_queue'
 
+CONSUMER_BATCH_SIZE = int(os.getenv('CONSUMER_BATCH_SIZE', 1))
+CONSUMER_BATCH_MAX_WAIT_MS = int(os.getenv('CONSUMER_BATCH_MAX_WAIT_MS', 5))
+
+API_WORKERS = int(os.getenv('API_WORKERS', 1))
+API_METRICS_DIR = os.getenv('API_METRICS_DIR', '')
+API_METRICS_DUMP_INTERVAL = float(os.getenv('API_METRICS_DUMP_INTERVAL', 1.0))
+API_CHANNEL_POOL_SIZE = int(os.getenv('API_CHANNEL_POOL_SIZE', 8))
+API_PUBLISHER_CONFIRMS = os.getenv('API_PUBLISHER_CONFIRMS', 'false').lower() == 'true'
+
+API_MAX_IN_FLIGHT = int(os.getenv('API_MAX_IN_FLIGHT', 1000))
+API_MAX_QUEUE_DEPTH = int(os.getenv('API_MAX_QUEUE_DEPTH', 10000))
+QUEUE_DEPTH_CHECK_INTERVAL = float(os.getenv('QUEUE_DEPTH_CHECK_INTERVAL', 1.0))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 1))
+
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() == 'true'
+DEDUP_TTL_SECONDS = float(os.getenv('DEDUP_TTL_SECONDS', 24 * 60 * 60))
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', 100000))
+DEDUP_DB_PATH = os.getenv('DEDUP_DB_PATH', '')
+DEDUP_PRUNE_INTERVAL = float(os.getenv('DEDUP_PRUNE_INTERVAL', 60))
+DEDUP_REQUEUE_DELAY_MS = int(os.getenv('DEDUP_REQUEUE_DELAY_MS', 100))
+
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 256))
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.01))
+TRACE_LOG_DIR = os.getenv('TRACE_LOG_DIR', '')
+
 STOP_WORDS: List[str] = ['bird-watching', 'ailurophobia', 'mango']
 
 EMAIL_SENDER = os.getenv('EMAIL_SENDER', '')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD', '')
 EMAIL_RECIPIENTS = os.getenv('EMAIL_RECIPIENTS', '').split(',')
+EMAIL_SEND_CONCURRENCY = int(os.getenv('EMAIL_SEND_CONCURRENCY', 8))
+
+EMAIL_DIGEST_ENABLED = os.getenv('EMAIL_DIGEST_ENABLED', 'false').lower() == 'true'
+EMAIL_DIGEST_MAX_MESSAGES = int(os.getenv('EMAIL_DIGEST_MAX_MESSAGES', 50))
+EMAIL_DIGEST_MAX_WAIT_MS = int(os.getenv('EMAIL_DIGEST_MAX_WAIT_MS', 1000))
+EMAIL_DIGEST_BY_ALIAS = os.getenv('EMAIL_DIGEST_BY_ALIAS', 'false').lower() == 'true'
 
 def get_rabbitmq_url() -> str:
-    return f'amqp://{RABBITMQ_USER}:{RABBITMQ_PASS}@{RABBITMQ_HOST}:{RABBITMQ_PORT}/'
\ No newline at end of file
+    return f'amqp://{RABBITMQ_USER}:{RABBITMQ_PASS}@{RABBITMQ_HOST}:{RABBITMQ_PORT}/'
+
+ENVELOPE_MAGIC = b'MQ'
+ENVELOPE_VERSION = 2
+ENVELOPE_PREFIXES = {
+    1: struct.Struct('!2sBBIH'),
+    2: struct.Struct('!2sBBIHH'),
+}
+ENVELOPE_PREFIX = ENVELOPE_PREFIXES[ENVELOPE_VERSION]
+ENVELOPE_METADATA = struct.Struct('!16sQQQ')
+FLAG_SAMPLED = 0x01
+MAX_IDEMPOTENCY_KEY_LENGTH = 256
+
+class Envelope:
+    __slots__ = ('data', 'view', 'version', 'flags', 'prefix_size', 'text_start', 'text_end', 'alias_end', 'key_end')
+
+    def __init__(self, data: bytes):
+        version = data[2] if len(data) > 2 else None
+        prefix = ENVELOPE_PREFIXES.get(version)
+        if prefix is None:
+            raise ValueError(f"Unsupported envelope version {version}")
+        try:
+            magic, self.version, self.flags, text_len, alias_len, *key_len = prefix.unpack_from(data)
+        except struct.error:
+            raise ValueError("Envelope is shorter than its header")
+        if magic != ENVELOPE_MAGIC:
+            raise ValueError("Not a message envelope")
+
+        self.prefix_size = prefix.size
+        self.text_start = prefix.size + ENVELOPE_METADATA.size
+        self.text_end = self.text_start + text_len
+        self.alias_end = self.text_end + alias_len
+        self.key_end = self.alias_end + (key_len[0] if key_len else 0)
+        if len(data) < self.key_end:
+            raise ValueError("Envelope is truncated")
+        self.data = data
+        self.view = memoryview(data)
+
+    @property
+    def text(self) -> str:
+        return str(self.view[self.text_start:self.text_end], 'utf-8')
+
+    @property
+    def user_alias(self) -> str:
+        return str(self.view[self.text_end:self.alias_end], 'utf-8')
+
+    @property
+    def idempotency_key(self) -> Optional[str]:
+        if self.key_end == self.alias_end:
+            return None
+        return str(self.view[self.alias_end:self.key_end], 'utf-8')
+
+    @property
+    def dedup_key(self) -> str:
+        key = self.idempotency_key
+        return f'key:{key}' if key is not None else f'id:{self.message_id}'
+
+    @property
+    def metadata(self) -> Tuple[bytes, int, int, int]:
+        return ENVELOPE_METADATA.unpack_from(self.data, self.prefix_size)
+
+    @property
+    def message_id(self) -> str:
+        return self.view[self.prefix_size:self.prefix_size + 16].hex()
+
+    @property
+    def trace_id(self) -> int:
+        return self.metadata[1]
+
+    @property
+    def created_at_ns(self) -> int:
+        return self.metadata[2]
+
+    @property
+    def forwarded_at_ns(self) -> int:
+        return self.metadata[3]
+
+    @property
+    def sampled(self) -> bool:
+        return bool(self.flags & FLAG_SAMPLED)
+
+    def with_text(self, text: str) -> bytes:
+        text_bytes = text.encode()
+        raw_message_id, trace_id, created_at_ns, _ = self.metadata
+        return b''.join((
+            ENVELOPE_PREFIX.pack(
+                ENVELOPE_MAGIC, ENVELOPE_VERSION, self.flags,
+                len(text_bytes), self.alias_end - self.text_end, self.key_end - self.alias_end
+            ),
+            ENVELOPE_METADATA.pack(raw_message_id, trace_id, created_at_ns, time.time_ns()),
+            text_bytes,
+            self.view[self.text_end:self.key_end]
+        ))
+
+def encode_message(text: str, user_alias: str, sampled: bool = False,
+                   idempotency_key: Optional[str] = None) -> bytes:
+    text_bytes = text.encode()
+    alias_bytes = user_alias.encode()
+    key_bytes = idempotency_key.encode() if idempotency_key is not None else b''
+    if len(key_bytes) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f"Idempotency key is longer than {MAX_IDEMPOTENCY_KEY_LENGTH} bytes")
+    now = time.time_ns()
+    return b''.join((
+        ENVELOPE_PREFIX.pack(
+            ENVELOPE_MAGIC, ENVELOPE_VERSION, FLAG_SAMPLED if sampled else 0,
+            len(text_bytes), len(alias_bytes), len(key_bytes)
+        ),
+        ENVELOPE_METADATA.pack(
+            random.getrandbits(128).to_bytes(16, 'big'), random.getrandbits(64), now, now
+        ),
+        text_bytes,
+        alias_bytes,
+        key_bytes
+    ))
+
+def decode_message(data: bytes) -> Envelope:
+    if data.startswith(ENVELOPE_MAGIC):
+        try:
+            envelope = Envelope(data)
+        except ValueError:
+            envelope = None
+        if envelope is not None and envelope.key_end == len(data):
+            return envelope
+    try:
+        text, separator, user_alias = bytes(data).decode().rpartition('|')
+    except UnicodeDecodeError:
+        separator = ''
+    if not separator:
+        raise ValueError("Message is neither an envelope nor text|user_alias")
+    return Envelope(encode_message(text, user_alias))
@@ -0,0 +1,42 @@
+import asyncio
+import contextlib
+import io
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pipes-version"))
+from main import Pipeline
+from processing import EmailFilter
+from utils import BAD_WORDS
+
+TEXT = "turnips for dinner"
+NEW_WORD = "turnips"
+
+def no_email(self, content: str):
+    pass
+
+async def run() -> list[str]:
+    pipeline = Pipeline()
+    pipeline.start()
+    try:
+        first = await pipeline.process_message(TEXT)
+        cached = await pipeline.process_message(TEXT)
+        assert pipeline.cache_hits.get() == 1, "The second request should be served from the result cache"
+
+        await pipeline.update_bad_words(BAD_WORDS + [NEW_WORD])
+        assert len(pipeline.cache) == 0, "Updating the stop list must clear the result cache"
+        reloaded = await pipeline.process_message(TEXT)
+        return [first, cached, reloaded]
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline.shutdown()
+
+def main():
+    EmailFilter._simulate_email_send = no_email
+    first, cached, reloaded = asyncio.run(run())
+    print(f"before reload: {first!r}, cached: {cached!r}, after adding {NEW_WORD!r}: {reloaded!r}")
+    assert first == cached == TEXT.upper(), "The original stop list should let the text through"
+    assert reloaded == "", "A cached result must not survive a stop list change"
+
+if __name__ == "__main__":
+    main()
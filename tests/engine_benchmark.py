@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pipes-version"))
+from main import Pipeline
+from processing import EmailFilter
+
+NUM_MESSAGES = 20000
+LATENCY_SAMPLES = 2000
+EMAIL_DELAY_MESSAGES = 2000
+EMAIL_DELAY_SAMPLES = 20
+WORKER_SAMPLE_INTERVAL = 0.1
+CHUNK_SIZE = 256
+MAX_CHUNKS_IN_FLIGHT = 16
+ENGINES = {
+    "process": {"screaming": "process", "profanity": "process", "email": "process"},
+    "mixed": {"screaming": "thread", "profanity": "thread", "email": "process"},
+    "thread": {"screaming": "thread", "profanity": "thread", "email": "thread"},
+}
+
+def no_email(self, content: str):
+    pass
+
+def quiet_email(self, content: str):
+    time.sleep(0.1 + (time.time() % 0.1))
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+async def measure_latency(pipeline: Pipeline, count: int) -> list[float]:
+    latencies = []
+    for i in range(count):
+        start_time = time.perf_counter()
+        await pipeline.process_message(f"latency probe {i}")
+        latencies.append(time.perf_counter() - start_time)
+    return latencies
+
+async def sample_workers(pipeline: Pipeline, peaks: dict[str, int]):
+    while True:
+        for pool in pipeline.pools:
+            peaks[pool.name] = max(peaks.get(pool.name, 0), pool.size)
+        await asyncio.sleep(WORKER_SAMPLE_INTERVAL)
+
+async def measure_throughput(pipeline: Pipeline, count: int) -> tuple[float, int, dict[str, int]]:
+    slots = asyncio.Semaphore(MAX_CHUNKS_IN_FLIGHT)
+    rejected = 0
+    peaks = {}
+
+    async def send(offset: int):
+        nonlocal rejected
+        async with slots:
+            results = await pipeline.process_messages(
+                [f"throughput message {i}" for i in range(offset, min(count, offset + CHUNK_SIZE))])
+        rejected += results.count(None)
+
+    monitor = asyncio.create_task(sample_workers(pipeline, peaks))
+    start_time = time.perf_counter()
+    try:
+        await asyncio.gather(*(send(offset) for offset in range(0, count, CHUNK_SIZE)))
+    finally:
+        monitor.cancel()
+    return count / (time.perf_counter() - start_time), rejected, peaks
+
+async def run(engines: dict[str, str], optimize: bool, num_messages: int,
+              samples: int) -> tuple[list[float], float, int, dict[str, int]]:
+    pipeline = Pipeline(engines=engines, optimize=optimize)
+    pipeline.start()
+    try:
+        await measure_latency(pipeline, min(100, samples))
+        latency = await measure_latency(pipeline, samples)
+        throughput, rejected, peaks = await measure_throughput(pipeline, num_messages)
+        return latency, throughput, rejected, peaks
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pipeline stage engines with email sending stubbed out")
+    parser.add_argument("--engine", choices=list(ENGINES), action="append",
+                        help="Engine preset to run; repeat for several (default: all)")
+    parser.add_argument("--unoptimized", action="store_true",
+                        help="Keep the declared stage order and run every stage separately")
+    parser.add_argument("--email-delay", action="store_true",
+                        help="Keep the simulated 100-200ms email send so the email stage has to autoscale")
+    parser.add_argument("--messages", type=int)
+    parser.add_argument("--samples", type=int)
+    args = parser.parse_args()
+    messages = args.messages or (EMAIL_DELAY_MESSAGES if args.email_delay else NUM_MESSAGES)
+    samples = args.samples or (EMAIL_DELAY_SAMPLES if args.email_delay else LATENCY_SAMPLES)
+
+    EmailFilter._simulate_email_send = quiet_email if args.email_delay else no_email
+    print(f"Sequential latency over {samples} messages, throughput over {messages} messages\n")
+    print(f"{'engine':<8} | {'p50 ms':>7} | {'p99 ms':>7} | {'max ms':>7} | {'msg/s':>8} | {'rejected':>8} | peak workers")
+    print("-" * 76)
+    for name in args.engine or list(ENGINES):
+        latency, throughput, rejected, peaks = asyncio.run(
+            run(ENGINES[name], not args.unoptimized, messages, samples))
+        workers = ", ".join(f"{pool}={size}" for pool, size in peaks.items())
+        print(f"{name:<8} | {percentile(latency, 50) * 1000:>7.3f} | {percentile(latency, 99) * 1000:>7.3f} | "
+              f"{max(latency) * 1000:>7.3f} | {throughput:>8.0f} | {rejected:>8} | {workers}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import timeit
+from typing import Callable, Dict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rabbitmq-version"))
+from utils import encode_message, decode_message
+
+NUMBER = 20000
+REPEATS = 5
+TEXT_SIZES = [32, 1024, 16384]
+USER_ALIAS = "tester_42"
+
+def legacy_hops(text: str) -> Dict[str, Callable[[], object]]:
+    body = f"{text}|{USER_ALIAS}".encode()
+    screamed = f"{text.upper()}|{USER_ALIAS}".encode()
+
+    def screaming_hop():
+        hop_text, hop_alias = body.decode().split('|')
+        return f"{hop_text.upper()}|{hop_alias}".encode()
+
+    return {
+        "encode": lambda: f"{text}|{USER_ALIAS}".encode(),
+        "filter hop": lambda: body.decode().split('|')[0],
+        "screaming hop": screaming_hop,
+        "publish hop": lambda: screamed.decode().split('|'),
+    }
+
+def envelope_hops(text: str) -> Dict[str, Callable[[], object]]:
+    body = encode_message(text, USER_ALIAS)
+    screamed = decode_message(body).with_text(text.upper())
+
+    def screaming_hop():
+        envelope = decode_message(body)
+        return envelope.with_text(envelope.text.upper())
+
+    def publish_hop():
+        envelope = decode_message(screamed)
+        return envelope.text, envelope.user_alias
+
+    return {
+        "encode": lambda: encode_message(text, USER_ALIAS),
+        "filter hop": lambda: decode_message(body).text,
+        "screaming hop": screaming_hop,
+        "publish hop": publish_hop,
+    }
+
+def ns_per_op(func: Callable[[], object]) -> float:
+    return min(timeit.repeat(func, number=NUMBER, repeat=REPEATS)) / NUMBER * 1e9
+
+def main():
+    print(f"ns per operation (best of {REPEATS} x {NUMBER})\n")
+    print(f"{'text bytes':>10} | {'operation':<14} | {'text|alias':>10} | {'envelope':>10}")
+    print("-" * 54)
+
+    for size in TEXT_SIZES:
+        text = ("message text " * (size // 13 + 1))[:size]
+        legacy = legacy_hops(text)
+        envelope = envelope_hops(text)
+        for operation in legacy:
+            print(f"{size:>10} | {operation:<14} | {ns_per_op(legacy[operation]):>10.0f} | "
+                  f"{ns_per_op(envelope[operation]):>10.0f}")
+
+    body = encode_message("a|b|c", USER_ALIAS)
+    assert decode_message(body).text == "a|b|c", "Envelope must survive '|' in text"
+
+    for text in ("MQ", "MQTT broker notes", "MQ\x02 looks like a header"):
+        legacy = decode_message(f"{text}|{USER_ALIAS}".encode())
+        assert (legacy.text, legacy.user_alias) == (text, USER_ALIAS), f"Legacy body {text!r} must not parse as an envelope"
+
+if __name__ == "__main__":
+    main()
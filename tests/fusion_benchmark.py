@@ -0,0 +1,145 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Any
+
+import aio_pika
+
+RABBITMQ_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rabbitmq-version")
+sys.path.append(RABBITMQ_DIR)
+from utils import get_rabbitmq_url, encode_message, decode_message, FILTER_QUEUE, SCREAMING_QUEUE, PUBLISH_QUEUE, STOP_WORDS
+from matcher import StopWordMatcher
+
+NUM_MESSAGES = 2000
+STARTUP_TIMEOUT = 15.0
+RECEIVE_TIMEOUT = 60.0
+
+MODES = {
+    "split": ["filter_service/main.py", "screaming_service/main.py"],
+    "fused": ["fused_service/main.py"],
+}
+
+TEST_MESSAGES = [
+    "Hello, this is a test message!",
+    "Testing the system performance",
+    "Another test message for load testing",
+    "bird-watching is fun",
+    "I love mangos",
+    "Someone with ailurophobia",
+    "This message should pass through",
+    "Load testing in progress",
+    "Final test message"
+]
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+def start_services(scripts: List[str]) -> List[subprocess.Popen]:
+    return [
+        subprocess.Popen(
+            [sys.executable, os.path.join(RABBITMQ_DIR, script)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        for script in scripts
+    ]
+
+def stop_services(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+async def wait_for_consumers(channel: aio_pika.abc.AbstractChannel, queue_names: List[str]):
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        counts = []
+        for name in queue_names:
+            queue = await channel.declare_queue(name, durable=True)
+            counts.append(queue.declaration_result.consumer_count)
+        if all(counts):
+            return
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Stage services did not start consuming {queue_names}")
+
+async def run_mode(mode: str, scripts: List[str]) -> Dict[str, Any]:
+    matcher = StopWordMatcher(STOP_WORDS)
+    texts = [TEST_MESSAGES[i % len(TEST_MESSAGES)] for i in range(NUM_MESSAGES)]
+    expected = sum(not blocked for blocked in matcher.scan_batch(texts))
+
+    connection = await aio_pika.connect_robust(get_rabbitmq_url())
+    processes = []
+    try:
+        channel = await connection.channel()
+        for name in (FILTER_QUEUE, SCREAMING_QUEUE, PUBLISH_QUEUE):
+            queue = await channel.declare_queue(name, durable=True)
+            await queue.purge()
+
+        processes = start_services(scripts)
+        await wait_for_consumers(channel, [FILTER_QUEUE] if mode == "fused" else [FILTER_QUEUE, SCREAMING_QUEUE])
+
+        sent_at: Dict[str, float] = {}
+        latencies: List[float] = []
+        done = asyncio.Event()
+
+        async def on_result(message: aio_pika.IncomingMessage):
+            async with message.process():
+                user_alias = decode_message(message.body).user_alias
+                latencies.append(time.perf_counter() - sent_at[user_alias])
+                if len(latencies) >= expected:
+                    done.set()
+
+        publish_queue = await channel.declare_queue(PUBLISH_QUEUE, durable=True)
+        await publish_queue.consume(on_result)
+
+        start_time = time.perf_counter()
+        publishes = []
+        for i, text in enumerate(texts):
+            user_alias = f"bench_{i}"
+            sent_at[user_alias] = time.perf_counter()
+            publishes.append(channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=encode_message(text, user_alias),
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                ),
+                routing_key=FILTER_QUEUE
+            ))
+        await asyncio.gather(*publishes)
+        await asyncio.wait_for(done.wait(), RECEIVE_TIMEOUT)
+        total_time = time.perf_counter() - start_time
+
+        return {
+            "mode": mode,
+            "messages": NUM_MESSAGES,
+            "delivered": len(latencies),
+            "throughput": NUM_MESSAGES / total_time,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    finally:
+        stop_services(processes)
+        await connection.close()
+
+async def main():
+    print("Stop publish_service before running: this benchmark consumes the publish queue itself.\n")
+    results = []
+    for mode, scripts in MODES.items():
+        print(f"Running {mode} topology with {NUM_MESSAGES} messages...")
+        results.append(await run_mode(mode, scripts))
+
+    print(f"\n{'mode':>6} | {'msg/s':>10} | {'p50 ms':>8} | {'p99 ms':>8} | {'delivered':>9}")
+    print("-" * 54)
+    for result in results:
+        print(f"{result['mode']:>6} | {result['throughput']:>10.1f} | {result['p50_ms']:>8.2f} | "
+              f"{result['p99_ms']:>8.2f} | {result['delivered']:>9}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
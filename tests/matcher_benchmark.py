@@ -0,0 +1,73 @@
+import os
+import random
+import string
+import sys
+import time
+from typing import Callable, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pipes-version"))
+from matcher import StopWordMatcher
+
+BASE_STOP_WORDS = ['bird-watching', 'ailurophobia', 'mango']
+STOP_LIST_SIZES = [3, 100, 1000, 5000]
+NUM_MESSAGES = 2000
+REPEATS = 3
+
+TEST_MESSAGES = [
+    "Hello, this is a test message!",
+    "Testing the system performance",
+    "Another test message for load testing",
+    "bird-watching is fun",
+    "I love mangos",
+    "Someone with ailurophobia",
+    "This message should pass through",
+    "Load testing in progress",
+    "Final test message"
+]
+
+def generate_stop_words(size: int) -> List[str]:
+    rng = random.Random(size)
+    words = list(BASE_STOP_WORDS)
+    while len(words) < size:
+        words.append(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(6, 14))))
+    return words
+
+def naive_scan(stop_words: List[str], texts: List[str]) -> List[bool]:
+    return [any(word.lower() in text.lower() for word in stop_words) for text in texts]
+
+def best_time(func: Callable[[], List[bool]]) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        start_time = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+def main():
+    texts = [random.choice(TEST_MESSAGES) for _ in range(NUM_MESSAGES)]
+
+    print(f"Scanning {NUM_MESSAGES} messages (best of {REPEATS}), us per message\n")
+    print(f"{'stop words':>10} | {'naive':>10} | {'contains':>10} | {'scan_batch':>10} | {'build ms':>8}")
+    print("-" * 62)
+
+    for size in STOP_LIST_SIZES:
+        stop_words = generate_stop_words(size)
+
+        start_time = time.perf_counter()
+        matcher = StopWordMatcher(stop_words)
+        build_time = time.perf_counter() - start_time
+
+        expected = naive_scan(stop_words, texts)
+        assert [matcher.contains(text) for text in texts] == expected
+        assert matcher.scan_batch(texts) == expected
+
+        naive = best_time(lambda: naive_scan(stop_words, texts))
+        single = best_time(lambda: [matcher.contains(text) for text in texts])
+        batch = best_time(lambda: matcher.scan_batch(texts))
+
+        print(f"{size:>10} | {naive / NUM_MESSAGES * 1e6:>10.2f} | "
+              f"{single / NUM_MESSAGES * 1e6:>10.2f} | {batch / NUM_MESSAGES * 1e6:>10.2f} | "
+              f"{build_time * 1000:>8.1f}")
+
+if __name__ == "__main__":
+    main()
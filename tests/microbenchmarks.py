@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import gc
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microbenchmark_baseline.json")
+
+MESSAGE_SIZES = [32, 1024, 16384]
+STOP_LIST_SIZES = [3, 100, 1000]
+BASE_STOP_WORDS = ['bird-watching', 'ailurophobia', 'mango']
+USER_ALIAS = "tester_42"
+REPEATS = 5
+MIN_REPEAT_SECONDS = 0.05
+ALLOCATION_SAMPLES = 50
+DEFAULT_THRESHOLD = 25.0
+
+Operation = Union[Callable[[], object], Callable[[], Awaitable[object]]]
+Case = Tuple[str, Operation, bool]
+
+def generate_stop_words(size: int) -> List[str]:
+    rng = random.Random(size)
+    words = list(BASE_STOP_WORDS)
+    while len(words) < size:
+        words.append(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(6, 14))))
+    return words
+
+def make_text(size: int, blocked: bool = False) -> str:
+    text = ("message text " * (size // 13 + 1))[:size]
+    return "mango " + text[6:] if blocked else text
+
+class FakeChannel:
+    def __init__(self):
+        self.published = 0
+
+    async def publish(self, body: bytes, routing_key: str, headers=None):
+        self.published += 1
+
+class FakeProcess:
+    def __init__(self, message: 'FakeIncomingMessage'):
+        self.message = message
+
+    async def __aenter__(self):
+        return self.message
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.message.ack()
+        else:
+            await self.message.reject()
+        return False
+
+class FakeIncomingMessage:
+    def __init__(self, body: bytes, channel: FakeChannel):
+        self.body = body
+        self.headers = None
+        self.channel = channel
+        self.acked = 0
+
+    def process(self) -> FakeProcess:
+        return FakeProcess(self)
+
+    async def ack(self, multiple: bool = False):
+        self.acked += 1
+
+    async def reject(self, requeue: bool = False):
+        pass
+
+def load_service(name: str):
+    path = os.path.join(ROOT_DIR, "rabbitmq-version", f"{name}_service", "main.py")
+    spec = importlib.util.spec_from_file_location(f"{name}_service", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def pipes_cases() -> List[Case]:
+    sys.path.insert(0, os.path.join(ROOT_DIR, "pipes-version"))
+    from processing import ProfanityFilter, ScreamingFilter
+
+    cases = []
+    screaming = ScreamingFilter([])
+    for size in MESSAGE_SIZES:
+        text = make_text(size)
+        cases.append((f"pipes/screaming/{size}B", lambda text=text: screaming._process(text), False))
+
+    for stop_words in STOP_LIST_SIZES:
+        profanity = ProfanityFilter([], generate_stop_words(stop_words))
+        for size in MESSAGE_SIZES:
+            for blocked in (False, True):
+                text = make_text(size, blocked)
+                outcome = "blocked" if blocked else "passed"
+                cases.append((f"pipes/profanity/{stop_words}w/{size}B/{outcome}",
+                              lambda profanity=profanity, text=text: profanity._process(text), False))
+    return cases
+
+def rabbitmq_cases() -> List[Case]:
+    sys.path.insert(0, os.path.join(ROOT_DIR, "rabbitmq-version"))
+    from dedup import DedupStore
+    from matcher import StopWordMatcher
+    from utils import decode_message, encode_message
+
+    filter_service = load_service("filter")
+    screaming_service = load_service("screaming")
+    fused_service = load_service("fused")
+    publish_service = load_service("publish")
+
+    async def no_sleep_email(subject: str, body: str, recipients: list):
+        pass
+
+    publish_service.simulate_email_send = no_sleep_email
+    publish_service.digest = None
+    publish_service.dedup = None
+
+    cases = []
+    channel = FakeChannel()
+    for size in MESSAGE_SIZES:
+        text = make_text(size)
+        legacy_body = f"{text}|{USER_ALIAS}".encode()
+        body = encode_message(text, USER_ALIAS)
+        message = FakeIncomingMessage(body, channel)
+        screamed = FakeIncomingMessage(decode_message(body).with_text(text.upper()), channel)
+
+        cases.extend([
+            (f"codec/legacy_encode/{size}B", lambda text=text: f"{text}|{USER_ALIAS}".encode(), False),
+            (f"codec/legacy_decode/{size}B", lambda body=legacy_body: body.decode().split('|'), False),
+            (f"codec/envelope_encode/{size}B", lambda text=text: encode_message(text, USER_ALIAS), False),
+            (f"codec/envelope_decode/{size}B",
+             lambda body=body: _read_fields(decode_message(body)), False),
+            (f"rabbitmq/screaming/{size}B",
+             lambda message=message: screaming_service.process_message(message), True),
+            (f"rabbitmq/publish/{size}B",
+             lambda message=screamed: publish_service.process_message(message), True),
+        ])
+
+    for stop_words in STOP_LIST_SIZES:
+        matcher = StopWordMatcher(generate_stop_words(stop_words))
+        for size in MESSAGE_SIZES:
+            for blocked in (False, True):
+                message = FakeIncomingMessage(encode_message(make_text(size, blocked), USER_ALIAS), channel)
+                outcome = "blocked" if blocked else "passed"
+                for name, service in (("filter", filter_service), ("fused", fused_service)):
+                    cases.append((f"rabbitmq/{name}/{stop_words}w/{size}B/{outcome}",
+                                  _with_matcher(service, matcher, message), True))
+
+    store = DedupStore(ttl_seconds=3600, max_entries=100000)
+    keys = (f"id:{i}" for i in itertools.count())
+
+    async def claim_and_complete():
+        key = next(keys)
+        store.claim(key)
+        await store.complete(key)
+
+    cases.append(("rabbitmq/dedup/claim_complete", claim_and_complete, True))
+    return cases
+
+def _read_fields(envelope):
+    return envelope.text, envelope.user_alias
+
+def _with_matcher(service, matcher, message: FakeIncomingMessage) -> Operation:
+    def operation():
+        service.stop_words = matcher
+        return service.process_message(message)
+    return operation
+
+SUITES = {
+    "pipes": pipes_cases,
+    "rabbitmq": rabbitmq_cases,
+}
+
+def measure(operation: Operation, is_async: bool) -> Dict[str, float]:
+    loop = asyncio.new_event_loop() if is_async else None
+
+    def run(number: int) -> float:
+        if is_async:
+            async def repeat():
+                start_time = time.perf_counter()
+                for _ in range(number):
+                    await operation()
+                return time.perf_counter() - start_time
+            return loop.run_until_complete(repeat())
+        start_time = time.perf_counter()
+        for _ in range(number):
+            operation()
+        return time.perf_counter() - start_time
+
+    gc.disable()
+    try:
+        number = 1
+        while run(number) < MIN_REPEAT_SECONDS:
+            number *= 2
+        best = min(run(number) for _ in range(REPEATS))
+        gc.enable()
+        peak_bytes, retained_blocks = allocations(operation, is_async, loop)
+    finally:
+        gc.enable()
+        if loop is not None:
+            loop.close()
+
+    return {
+        "ns_per_op": best / number * 1e9,
+        "peak_bytes_per_op": peak_bytes,
+        "retained_blocks_per_op": retained_blocks,
+    }
+
+def allocations(operation: Operation, is_async: bool, loop) -> Tuple[float, float]:
+    def call():
+        if is_async:
+            return loop.run_until_complete(operation())
+        return operation()
+
+    call()
+    blocks_before = sys.getallocatedblocks()
+    for _ in range(ALLOCATION_SAMPLES):
+        call()
+    retained_blocks = (sys.getallocatedblocks() - blocks_before) / ALLOCATION_SAMPLES
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(ALLOCATION_SAMPLES):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            call()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return peaks[len(peaks) // 2], retained_blocks
+
+def run_suite(name: str) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for case_name, operation, is_async in SUITES[name]():
+        results[case_name] = measure(operation, is_async)
+    return results
+
+def check(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+          threshold: float) -> List[str]:
+    regressions = []
+    for case_name, result in results.items():
+        expected = baseline.get(case_name)
+        if expected is None or not expected["ns_per_op"]:
+            continue
+        delta = (result["ns_per_op"] - expected["ns_per_op"]) / expected["ns_per_op"] * 100
+        if delta > threshold:
+            regressions.append(f"{case_name}: {expected['ns_per_op']:.0f} -> {result['ns_per_op']:.0f} ns/op "
+                               f"({delta:+.1f}%)")
+    return regressions
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Broker-free microbenchmarks for stage functions and codecs")
+    parser.add_argument("--suite", choices=sorted(SUITES), action="append",
+                        help="Suite to run (default: all)")
+    parser.add_argument("--filter", default="", help="Only print and compare cases whose name contains this")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file")
+    parser.add_argument("--save", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit with status 1 when a case is slower than the baseline by more than --threshold")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown in percent")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    suites = args.suite or sorted(SUITES)
+
+    # The pipes and RabbitMQ trees both define utils/metrics/matcher, so each suite runs in a fresh interpreter.
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for suite in suites:
+        with context.Pool(1) as pool:
+            results.update(pool.apply(run_suite, (suite,)))
+    results = {name: result for name, result in results.items() if args.filter in name}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{'case':<46} | {'ns/op':>10} | {'baseline':>10} | {'peak B/op':>9} | {'blocks/op':>9}")
+    print("-" * 96)
+    for case_name, result in results.items():
+        expected = baseline.get(case_name, {}).get("ns_per_op")
+        expected_text = f"{expected:>10.0f}" if expected else f"{'-':>10}"
+        print(f"{case_name:<46} | {result['ns_per_op']:>10.0f} | {expected_text} | "
+              f"{result['peak_bytes_per_op']:>9.0f} | {result['retained_blocks_per_op']:>9.2f}")
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if args.check:
+        regressions = check(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.threshold:g}%:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo cases slower than baseline by more than {args.threshold:g}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOCS_PATH = os.path.join(ROOT_DIR, "docs", "performance_comparison.md")
+TABLES_START = "<!-- performance-tables:start -->"
+TABLES_END = "<!-- performance-tables:end -->"
+DEFAULT_THRESHOLD = 10.0
+
+# (metric key, label, scale, higher is better)
+METRICS = [
+    ("requests_per_second", "Throughput (msg/s)", 1, True),
+    ("avg_response_time", "Avg Response Time (ms)", 1000, False),
+    ("p50_response_time", "p50 Response Time (ms)", 1000, False),
+    ("p99_response_time", "p99 Response Time (ms)", 1000, False),
+    ("p999_response_time", "p99.9 Response Time (ms)", 1000, False),
+    ("avg_cpu_percent", "CPU Usage (%)", 1, False),
+    ("avg_memory_mb", "Memory Usage (MB)", 1, False),
+    ("success_rate", "Success Rate (%)", 1, True)
+]
+
+SCENARIO_NAMES = {
+    (100, 1): "Light Load",
+    (100, 10): "Medium Load",
+    (1000, 10): "Heavy Load",
+    (1000, 50): "Stress Test"
+}
+
+# Result files written before the open/closed-loop generator have no mode
+# and count num_messages per user.
+LEGACY_MODE = "legacy"
+
+ScenarioKey = Tuple[int, int, str, Optional[float]]
+
+def scenario_key(config: Dict[str, Any]) -> ScenarioKey:
+    num_messages = config["num_messages"]
+    if "mode" not in config:
+        num_messages *= config["concurrent_users"]
+    return (num_messages, config["concurrent_users"], config.get("mode", LEGACY_MODE), config.get("rate"))
+
+def scenario_title(key: ScenarioKey) -> str:
+    num_messages, users, mode, rate = key
+    if mode == "open":
+        return f"Open Loop ({num_messages} messages at {rate:g} msg/s)"
+    users_label = f"{users} user{'s' if users != 1 else ''}"
+    if mode == LEGACY_MODE:
+        per_user = num_messages // users
+        name = SCENARIO_NAMES.get((per_user, users), "Closed Loop")
+        return f"{name} ({per_user} messages per user, {users_label}, {num_messages} total)"
+    name = SCENARIO_NAMES.get((num_messages, users), "Closed Loop")
+    return f"{name} ({num_messages} messages, {users_label})"
+
+def load_results(paths: List[str]) -> Dict[ScenarioKey, Dict[str, float]]:
+    runs: Dict[ScenarioKey, List[Dict[str, float]]] = {}
+    for path in paths:
+        with open(path) as f:
+            entries = json.load(f)
+        for entry in entries:
+            metrics = dict(entry["metrics"])
+            if not metrics.get("total_requests"):
+                continue
+            metrics["success_rate"] = metrics["successful_requests"] / metrics["total_requests"] * 100
+            runs.setdefault(scenario_key(entry["config"]), []).append(metrics)
+
+    return {key: _median_metrics(samples) for key, samples in runs.items()}
+
+def _median_metrics(samples: List[Dict[str, float]]) -> Dict[str, float]:
+    merged = {}
+    for key, _, _, _ in METRICS:
+        values = [sample[key] for sample in samples if isinstance(sample.get(key), (int, float))]
+        if values:
+            merged[key] = statistics.median(values)
+    return merged
+
+def compare(baseline: Dict[ScenarioKey, Dict[str, float]], candidate: Dict[ScenarioKey, Dict[str, float]],
+            threshold: float) -> Tuple[List[str], List[str]]:
+    lines = []
+    regressions = []
+    for key in sorted(set(baseline) & set(candidate), key=_sort_key):
+        lines.append(f"\n### {scenario_title(key)}\n")
+        lines.append("| Metric | Baseline | Candidate | Delta |")
+        lines.append("|--------|----------|-----------|-------|")
+        for metric, label, scale, higher_is_better in METRICS:
+            before = baseline[key].get(metric)
+            after = candidate[key].get(metric)
+            if before is None or after is None:
+                continue
+            delta = (after - before) / before * 100 if before else None
+            regressed = delta is not None and (-delta if higher_is_better else delta) > threshold
+            delta_text = "n/a" if delta is None else f"{delta:+.1f}%"
+            if regressed:
+                delta_text += " REGRESSION"
+                regressions.append(f"{scenario_title(key)}: {label} {_format(before * scale)} -> "
+                                   f"{_format(after * scale)} ({delta:+.1f}%)")
+            lines.append(f"| {label} | {_format(before * scale)} | {_format(after * scale)} | {delta_text} |")
+
+    for key in sorted(set(baseline) ^ set(candidate), key=_sort_key):
+        side = "baseline" if key in baseline else "candidate"
+        lines.append(f"\n{scenario_title(key)}: only in {side}, skipped")
+    return lines, regressions
+
+def comparison_tables(rabbitmq: Dict[ScenarioKey, Dict[str, float]],
+                      pipes: Dict[ScenarioKey, Dict[str, float]]) -> str:
+    sections = []
+    for key in sorted(set(rabbitmq) & set(pipes), key=_sort_key):
+        lines = [f"### {scenario_title(key)}", "",
+                 "| Metric | RabbitMQ | Pipes-and-Filters |",
+                 "|--------|----------|-------------------|"]
+        for metric, label, scale, _ in METRICS:
+            if metric in rabbitmq[key] and metric in pipes[key]:
+                lines.append(f"| {label} | {_format(rabbitmq[key][metric] * scale)} | "
+                             f"{_format(pipes[key][metric] * scale)} |")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+def write_docs(path: str, tables: str):
+    with open(path) as f:
+        content = f.read()
+    start = content.find(TABLES_START)
+    end = content.find(TABLES_END)
+    if start < 0 or end < start:
+        raise ValueError(f"{path} has no {TABLES_START} ... {TABLES_END} section")
+    content = content[:start + len(TABLES_START)] + "\n\n" + tables + "\n\n" + content[end:]
+    with open(path, 'w') as f:
+        f.write(content)
+
+def _sort_key(key: ScenarioKey):
+    num_messages, users, mode, rate = key
+    return ((mode == "open", mode == LEGACY_MODE), num_messages, users, rate or 0)
+
+def _format(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return f"{value:.2f}"
+
+def _expand(patterns: List[str]) -> List[str]:
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise FileNotFoundError(f"No result files match {pattern}")
+        paths.extend(matches)
+    return paths
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare performance_results_*.json files")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compare_parser = commands.add_parser("compare", help="Compare candidate runs against baseline runs")
+    compare_parser.add_argument("--baseline", nargs="+", required=True, help="Baseline result files or globs")
+    compare_parser.add_argument("--candidate", nargs="+", required=True, help="Candidate result files or globs")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Percent change in the worse direction that counts as a regression")
+
+    tables_parser = commands.add_parser("tables", help="Build RabbitMQ vs Pipes-and-Filters comparison tables")
+    tables_parser.add_argument("--rabbitmq", nargs="+", required=True, help="RabbitMQ result files or globs")
+    tables_parser.add_argument("--pipes", nargs="+", required=True, help="Pipes-and-Filters result files or globs")
+    tables_parser.add_argument("--write", nargs="?", const=DOCS_PATH,
+                               help="Replace the tables in the comparison doc instead of printing them")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.command == "compare":
+        lines, regressions = compare(load_results(_expand(args.baseline)),
+                                     load_results(_expand(args.candidate)), args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:g}%:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:g}%")
+        return
+
+    tables = comparison_tables(load_results(_expand(args.rabbitmq)), load_results(_expand(args.pipes)))
+    if args.write:
+        write_docs(args.write, tables)
+        print(f"Updated {args.write}")
+    else:
+        print(tables)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,25 @@
-import requests
-import time
-import random
-import concurrent.futures
-import psutil
-import os
-from typing import List, Dict, Any
+import argparse
+import asyncio
 import json
-from datetime import datetime
-import signal
+import os
+import random
 import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
-API_URL = "http://localhost:8000/message"
+import aiohttp
+import psutil
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pipes-version"))
+from stats import LatencySnapshot, bucket_index
+
+BASE_URL = "http://localhost:8000"
 CONNECTION_TIMEOUT = 5.0
 REQUEST_TIMEOUT = 10.0
+SAMPLE_INTERVAL = 0.1
+OPEN_LOOP_CONNECTIONS = 1000
 
 TEST_MESSAGES = [
     "Hello, this is a test message!",
@@ -26,214 +33,245 @@ TEST_MESSAGES = [
     "Final test message"
 ]
 
-def verify_service_availability() -> bool:
+@dataclass
+class Scenario:
+    test_name: str
+    mode: str
+    num_messages: int
+    concurrent_users: int
+    rate: Optional[float] = None
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "num_messages": self.num_messages,
+            "concurrent_users": self.concurrent_users,
+            "mode": self.mode,
+            "rate": self.rate
+        }
+
+SCENARIOS = [
+    Scenario("Test 1", "closed", 100, 1),
+    Scenario("Test 2", "closed", 100, 10),
+    Scenario("Test 3", "closed", 1000, 10),
+    Scenario("Test 4", "closed", 1000, 50),
+    Scenario("Test 5", "open", 1000, OPEN_LOOP_CONNECTIONS, rate=50),
+    Scenario("Test 6", "open", 2000, OPEN_LOOP_CONNECTIONS, rate=200)
+]
+
+class LoadResults:
+    def __init__(self):
+        self.latency = LatencySnapshot()
+        self.service_time = LatencySnapshot()
+        self.status_counts: Dict[str, int] = {}
+        self.total_requests = 0
+        self.successful_requests = 0
+
+    def record(self, intended: float, sent: float, finished: float, status: str):
+        self.total_requests += 1
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        if status == "200":
+            self.successful_requests += 1
+        _observe(self.latency, finished - intended)
+        _observe(self.service_time, finished - sent)
+
+def _observe(histogram: LatencySnapshot, value: float):
+    histogram.counts[bucket_index(value)] += 1
+    histogram.total += value
+
+async def verify_service_availability(session: aiohttp.ClientSession, base_url: str) -> bool:
     try:
-        response = requests.get(
-            "http://localhost:8000/health",
-            timeout=CONNECTION_TIMEOUT
-        )
-        if response.status_code == 200:
-            health_data = response.json()
+        async with session.get(f"{base_url}/health") as response:
+            if response.status != 200:
+                return False
+            health_data = await response.json()
             return health_data.get("status") == "healthy"
-        return False
-    except requests.exceptions.RequestException as e:
-        print(f"Health check failed: {str(e)}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Health check failed: {str(e) or type(e).__name__}")
         return False
 
-def send_message(message: str, user_alias: str) -> Dict[str, Any]:
+async def send_message(session: aiohttp.ClientSession, url: str, user_alias: str,
+                       intended: float, results: LoadResults):
+    sent = time.perf_counter()
     try:
-        start_time = time.time()
-        response = requests.post(
-            API_URL,
-            json={"text": message, "user_alias": user_alias},
-            timeout=(CONNECTION_TIMEOUT, REQUEST_TIMEOUT)
-        )
-        end_time = time.time()
-        
-        return {
-            "success": response.status_code == 200,
-            "response_time": end_time - start_time,
-            "status_code": response.status_code,
-            "error": response.text if response.status_code != 200 else None
-        }
-    except requests.exceptions.ConnectionError as e:
-        print(f"Connection error: {str(e)}")
-        return {
-            "success": False,
-            "response_time": 0,
-            "status_code": 0,
-            "error": "Connection failed - Is the API service running?"
-        }
-    except requests.exceptions.Timeout as e:
-        print(f"Timeout error: {str(e)}")
-        return {
-            "success": False,
-            "response_time": REQUEST_TIMEOUT,
-            "status_code": 0,
-            "error": "Request timed out"
-        }
-    except requests.exceptions.RequestException as e:
-        print(f"Request error: {str(e)}")
-        return {
-            "success": False,
-            "response_time": 0,
-            "status_code": 0,
-            "error": str(e)
-        }
+        async with session.post(url, json={"text": random.choice(TEST_MESSAGES), "user_alias": user_alias}) as response:
+            await response.read()
+            status = str(response.status)
+    except asyncio.TimeoutError:
+        results.record(intended, sent, sent + REQUEST_TIMEOUT, "timeout")
+        return
+    except aiohttp.ClientError:
+        status = "connection_error"
+    results.record(intended, sent, time.perf_counter(), status)
+
+async def run_open_loop(session: aiohttp.ClientSession, url: str, scenario: Scenario, results: LoadResults):
+    interval = 1 / scenario.rate
+    start_time = time.perf_counter()
+    tasks = []
+    for i in range(scenario.num_messages):
+        intended = start_time + i * interval
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send_message(session, url, f"tester_{i % 100}", intended, results)))
+    await asyncio.gather(*tasks)
+
+async def run_closed_loop(session: aiohttp.ClientSession, url: str, scenario: Scenario, results: LoadResults):
+    interval = scenario.concurrent_users / scenario.rate if scenario.rate else 0.0
+    start_time = time.perf_counter()
+    remaining = scenario.num_messages
+
+    async def user(user_id: int):
+        nonlocal remaining
+        sent = 0
+        while remaining > 0:
+            remaining -= 1
+            if interval:
+                intended = start_time + sent * interval
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                intended = time.perf_counter()
+            await send_message(session, url, f"tester_{user_id}", intended, results)
+            sent += 1
 
-def monitor_system_resources() -> Dict[str, float]:
+    await asyncio.gather(*(user(i) for i in range(scenario.concurrent_users)))
+
+async def monitor_system_resources(samples: List[Dict[str, float]]):
     process = psutil.Process(os.getpid())
+    psutil.cpu_percent()
+    while True:
+        await asyncio.sleep(SAMPLE_INTERVAL)
+        samples.append({
+            "cpu_percent": psutil.cpu_percent(),
+            "memory_mb": process.memory_info().rss / 1024 / 1024
+        })
+
+async def run_performance_test(base_url: str, scenario: Scenario) -> Dict[str, Any]:
+    results = LoadResults()
+    system_metrics: List[Dict[str, float]] = []
+    connector = aiohttp.TCPConnector(limit=scenario.concurrent_users)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, sock_connect=CONNECTION_TIMEOUT)
+    run = run_open_loop if scenario.mode == "open" else run_closed_loop
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        monitor = asyncio.create_task(monitor_system_resources(system_metrics))
+        start_time = time.perf_counter()
+        try:
+            await run(session, f"{base_url}/message", scenario, results)
+        finally:
+            end_time = time.perf_counter()
+            monitor.cancel()
+
+    duration = end_time - start_time
+    latency = results.latency
+    service_time = results.service_time
+    successful = results.successful_requests
+    total = results.total_requests
     return {
-        "cpu_percent": psutil.cpu_percent(),
-        "memory_percent": process.memory_percent(),
-        "memory_mb": process.memory_info().rss / 1024 / 1024
+        "total_time": duration,
+        "total_requests": total,
+        "successful_requests": successful,
+        "failed_requests": total - successful,
+        "avg_response_time": latency.total / total if total else 0,
+        "p50_response_time": latency.quantile(0.5),
+        "p99_response_time": latency.quantile(0.99),
+        "p999_response_time": latency.quantile(0.999),
+        "max_response_time": latency.quantile(1.0),
+        "avg_service_time": service_time.total / total if total else 0,
+        "p99_service_time": service_time.quantile(0.99),
+        "requests_per_second": successful / duration if duration > 0 else 0,
+        "status_counts": results.status_counts,
+        "avg_cpu_percent": sum(m["cpu_percent"] for m in system_metrics) / len(system_metrics) if system_metrics else 0,
+        "avg_memory_mb": sum(m["memory_mb"] for m in system_metrics) / len(system_metrics) if system_metrics else 0,
+        "test_duration": duration
     }
 
-def run_performance_test(
-    num_messages: int,
-    concurrent_users: int,
-    test_messages: List[str] = TEST_MESSAGES
-) -> Dict[str, Any]:
-    
+async def wait_for_service(base_url: str, retries: int = 3) -> bool:
+    timeout = aiohttp.ClientTimeout(total=CONNECTION_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        for attempt in range(retries):
+            if await verify_service_availability(session, base_url):
+                return True
+            if attempt < retries - 1:
+                print(f"Health check failed, retrying in 5 seconds... (Attempt {attempt + 1}/{retries})")
+                await asyncio.sleep(5)
+    return False
+
+def print_results(test_name: str, result: Dict[str, Any]):
+    print(f"\n{test_name} Results:")
+    print(f"Total time: {result['total_time']:.2f} seconds")
+    print(f"Successful requests: {result['successful_requests']}")
+    print(f"Failed requests: {result['failed_requests']} {result['status_counts']}")
+    print(f"Latency p50/p99/p99.9: {result['p50_response_time']*1000:.2f} / "
+          f"{result['p99_response_time']*1000:.2f} / {result['p999_response_time']*1000:.2f} ms")
+    print(f"Average response time: {result['avg_response_time']*1000:.2f} ms "
+          f"(service time {result['avg_service_time']*1000:.2f} ms)")
+    print(f"Requests per second: {result['requests_per_second']:.2f}")
+    print(f"Average CPU usage: {result['avg_cpu_percent']:.1f}%")
+    print(f"Average memory usage: {result['avg_memory_mb']:.1f} MB")
+
+async def run_scenarios(base_url: str, scenarios: List[Scenario], label: Optional[str]) -> List[Dict[str, Any]]:
     results = []
-    system_metrics = []
-    running = True
-    
-    def signal_handler(signum, frame):
-        nonlocal running
-        print("\nGracefully shutting down...")
-        running = False
-    
-    signal.signal(signal.SIGINT, signal_handler)
-    
-    def send_messages(user_id: int) -> List[Dict[str, Any]]:
-        user_results = []
-        messages_sent = 0
-        
-        while running and messages_sent < num_messages:
-            message = random.choice(test_messages)
-            result = send_message(message, f"tester_{user_id}")
-            
-            if result["success"]:
-                messages_sent += 1
-            elif result["error"]:
-                print(f"Error sending message: {result['error']}")
-            
-            user_results.append(result)
-            time.sleep(0.1)
-        
-        return user_results
+    for scenario in scenarios:
+        pacing = f" at {scenario.rate} msg/s" if scenario.rate else ""
+        print(f"\nStarting {scenario.test_name} ({scenario.mode} loop) with {scenario.num_messages} messages "
+              f"and {scenario.concurrent_users} connections{pacing}...")
 
-    try:
-        start_time = time.time()
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrent_users) as executor:
-            future_to_user = {
-                executor.submit(send_messages, i): i 
-                for i in range(concurrent_users)
-            }
-            
-            while running and any(not future.done() for future in future_to_user):
-                system_metrics.append(monitor_system_resources())
-                time.sleep(0.1)
-                
-            for future in concurrent.futures.as_completed(future_to_user):
-                try:
-                    results.extend(future.result())
-                except Exception as e:
-                    print(f"User task failed: {str(e)}")
-        
-        end_time = time.time()
-        
-        successful_requests = [r for r in results if r["success"]]
-        failed_requests = [r for r in results if not r["success"]]
-        
-        if not results:
-            return {"error": "No results collected"}
-        
-        return {
-            "total_time": end_time - start_time,
-            "total_requests": len(results),
-            "successful_requests": len(successful_requests),
-            "failed_requests": len(failed_requests),
-            "avg_response_time": sum(r["response_time"] for r in successful_requests) / len(successful_requests) if successful_requests else 0,
-            "requests_per_second": len(successful_requests) / (end_time - start_time) if end_time > start_time else 0,
-            "avg_cpu_percent": sum(m["cpu_percent"] for m in system_metrics) / len(system_metrics) if system_metrics else 0,
-            "avg_memory_mb": sum(m["memory_mb"] for m in system_metrics) / len(system_metrics) if system_metrics else 0,
-            "test_duration": end_time - start_time
-        }
-    
-    except KeyboardInterrupt:
-        print("\nTest interrupted by user")
-        return {"error": "Test interrupted by user"}
-    except Exception as e:
-        print(f"\nTest failed: {str(e)}")
-        return {"error": str(e)}
+        if not await wait_for_service(base_url, retries=1):
+            print("Error: API service became unavailable")
+            break
+
+        result = await run_performance_test(base_url, scenario)
+        entry = {"test_name": scenario.test_name, "config": scenario.config(), "metrics": result}
+        if label:
+            entry["label"] = label
+        results.append(entry)
+        print_results(scenario.test_name, result)
+    return results
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the message API")
+    parser.add_argument("--url", default=BASE_URL, help="API base URL")
+    parser.add_argument("--label", help="Implementation label stored with each result, e.g. rabbitmq or pipes")
+    parser.add_argument("--mode", choices=["open", "closed"],
+                        help="Run a single scenario: open (fixed arrival rate) or closed (fixed concurrency)")
+    parser.add_argument("--messages", type=int, default=1000, help="Messages to send in a single scenario")
+    parser.add_argument("--users", type=int, help="Concurrent users (closed) or connection limit (open)")
+    parser.add_argument("--rate", type=float, help="Target messages per second; required for open mode")
+    parser.add_argument("--output-dir", default=".", help="Directory for the results file")
+    return parser.parse_args()
 
 def main():
-    print("Verifying service health...")
-    retries = 3
-    for attempt in range(retries):
-        if verify_service_availability():
-            break
-        if attempt < retries - 1:
-            print(f"Health check failed, retrying in 5 seconds... (Attempt {attempt + 1}/{retries})")
-            time.sleep(5)
+    args = parse_args()
+    if args.mode == "open" and not args.rate:
+        print("Error: --rate is required for open loop mode")
+        sys.exit(2)
+
+    if args.mode:
+        users = args.users or (OPEN_LOOP_CONNECTIONS if args.mode == "open" else 10)
+        scenarios = [Scenario("Custom", args.mode, args.messages, users, args.rate)]
     else:
+        scenarios = SCENARIOS
+
+    print("Verifying service health...")
+    if not asyncio.run(wait_for_service(args.url)):
         print("Error: API service is not healthy. Please check the service status.")
         sys.exit(1)
-    
+
     print("Service is healthy, starting tests...")
-    
-    scenarios = [
-        (100, 1, "Test 1"),
-        (100, 10, "Test 2"),
-        (1000, 10, "Test 3"),
-        (1000, 50, "Test 4")
-    ]
-    
-    results = []
-    
-    for num_messages, concurrent_users, test_name in scenarios:
-        print(f"\nStarting {test_name} test with {num_messages} messages and {concurrent_users} concurrent users...")
-        
-        if not verify_service_availability():
-            print("Error: API service became unavailable")
-            break
-            
-        result = run_performance_test(
-            num_messages=num_messages,
-            concurrent_users=concurrent_users
-        )
-        
-        if "error" in result:
-            print(f"Test failed: {result['error']}")
-            break
-        
-        results.append({
-            "test_name": test_name,
-            "config": {
-                "num_messages": num_messages,
-                "concurrent_users": concurrent_users
-            },
-            "metrics": result
-        })
-        
-        print(f"\n{test_name} Results:")
-        print(f"Total time: {result['total_time']:.2f} seconds")
-        print(f"Successful requests: {result['successful_requests']}")
-        print(f"Failed requests: {result['failed_requests']}")
-        print(f"Average response time: {result['avg_response_time']*1000:.2f} ms")
-        print(f"Requests per second: {result['requests_per_second']:.2f}")
-        print(f"Average CPU usage: {result['avg_cpu_percent']:.1f}%")
-        print(f"Average memory usage: {result['avg_memory_mb']:.1f} MB")
-    
+    try:
+        results = asyncio.run(run_scenarios(args.url, scenarios, args.label))
+    except KeyboardInterrupt:
+        print("\nTest interrupted by user")
+        sys.exit(1)
+
     if results:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"performance_results_{timestamp}.json"
+        filename = os.path.join(args.output_dir, f"performance_results_{timestamp}.json")
         with open(filename, 'w') as f:
             json.dump(results, f, indent=2)
         print(f"\nResults saved to {filename}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
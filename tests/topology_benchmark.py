@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rabbitmq-version")
+sys.path.append(SERVICES_DIR)
+from transport import AmqpTransport, MemoryTransport, Transport
+from utils import FILTER_QUEUE, encode_message, get_rabbitmq_url
+
+NUM_MESSAGES = 5000
+USER_ALIAS = "tester_42"
+
+def load_service(name: str):
+    path = os.path.join(SERVICES_DIR, f"{name}_service", "main.py")
+    spec = importlib.util.spec_from_file_location(f"{name}_service", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+async def run(transport: Transport, fused: bool, num_messages: int) -> float:
+    publish_service = load_service("publish")
+    delivered = 0
+    done = asyncio.Event()
+
+    async def no_sleep_email(subject: str, body: str, recipients: list):
+        nonlocal delivered
+        delivered += 1
+        if delivered == num_messages:
+            done.set()
+
+    publish_service.simulate_email_send = no_sleep_email
+    publish_service.digest = None
+
+    await transport.connect()
+    try:
+        for name in (["fused"] if fused else ["filter", "screaming"]):
+            await load_service(name).start(transport)
+        await publish_service.start(transport)
+
+        bodies = [encode_message(f"benchmark message {i}", USER_ALIAS) for i in range(num_messages)]
+        channel = await transport.channel()
+        start_time = time.perf_counter()
+        for body in bodies:
+            await channel.publish(body, routing_key=FILTER_QUEUE)
+        await done.wait()
+        return time.perf_counter() - start_time
+    finally:
+        await publish_service.stop()
+        await transport.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Push messages through the full RabbitMQ-version topology")
+    parser.add_argument("--transport", choices=["memory", "amqp"], default="memory",
+                        help="memory runs every service on an in-process broker, amqp uses RabbitMQ")
+    parser.add_argument("--fused", action="store_true", help="Use the fused filter+screaming stage")
+    parser.add_argument("--messages", type=int, default=NUM_MESSAGES)
+    args = parser.parse_args()
+
+    transport = MemoryTransport() if args.transport == "memory" else AmqpTransport(get_rabbitmq_url())
+    elapsed = asyncio.run(run(transport, args.fused, args.messages))
+    print(f"\n{args.transport} transport, {'fused' if args.fused else 'filter + screaming'}: "
+          f"{args.messages} messages in {elapsed:.2f}s, {args.messages / elapsed:.0f} msg/s, "
+          f"{elapsed / args.messages * 1e6:.1f} us per message")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+from typing import Dict, List
+
+STAGE_ORDER = ["api", "filter", "fused", "screaming", "publish"]
+PERCENTILES = [50, 95, 99]
+
+def load_spans(paths: List[str]) -> List[dict]:
+    spans = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path]
+        for file in files:
+            with open(file) as f:
+                spans.extend(json.loads(line) for line in f if line.strip())
+    return [span for span in spans if span.get("done_ns")]
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    return {"mean": statistics.mean(values), **{f"p{p}": percentile(values, p) for p in PERCENTILES}}
+
+def stage_breakdown(spans: List[dict]) -> Dict[str, Dict[str, List[float]]]:
+    stages: Dict[str, Dict[str, List[float]]] = {}
+    for span in spans:
+        stage = stages.setdefault(span["service"], {"queue_wait": [], "service_time": []})
+        stage["queue_wait"].append((span["dequeued_ns"] - span["enqueued_ns"]) / 1e6)
+        stage["service_time"].append((span["done_ns"] - span["dequeued_ns"]) / 1e6)
+    return stages
+
+def end_to_end(spans: List[dict]) -> List[float]:
+    return [(span["done_ns"] - span["ingest_ns"]) / 1e6 for span in spans
+            if span["service"] == "publish" and span.get("ingest_ns")]
+
+def print_report(spans: List[dict]):
+    stages = stage_breakdown(spans)
+    total = end_to_end(spans)
+    mean_total = statistics.mean(total) if total else 0.0
+
+    columns = " | ".join(f"{f'p{p}':>8}" for p in PERCENTILES)
+    print(f"{len(spans)} spans, {len(total)} complete traces\n")
+    print(f"{'stage':<10} | {'part':<12} | {'mean ms':>8} | {columns} | {'share':>6}")
+    print("-" * (50 + 11 * len(PERCENTILES)))
+    names = sorted(stages, key=lambda name: (STAGE_ORDER.index(name) if name in STAGE_ORDER else len(STAGE_ORDER), name))
+    for name in names:
+        for part in ("queue_wait", "service_time"):
+            summary = summarize(stages[name][part])
+            share = f"{summary['mean'] / mean_total * 100:>5.1f}%" if mean_total else f"{'-':>6}"
+            values = " | ".join(f"{summary[f'p{p}']:>8.2f}" for p in PERCENTILES)
+            print(f"{name:<10} | {part:<12} | {summary['mean']:>8.2f} | {values} | {share}")
+
+    if total:
+        summary = summarize(total)
+        values = " | ".join(f"{summary[f'p{p}']:>8.2f}" for p in PERCENTILES)
+        print(f"{'total':<10} | {'end_to_end':<12} | {summary['mean']:>8.2f} | {values} | {'100.0%':>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage queue wait vs service time from trace logs")
+    parser.add_argument("paths", nargs="+", help="Trace log files or TRACE_LOG_DIR directories")
+    args = parser.parse_args()
+
+    spans = load_spans(args.paths)
+    if not spans:
+        print("No spans found")
+        return
+    print_report(spans)
+
+if __name__ == "__main__":
+    main()
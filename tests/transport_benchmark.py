@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Process, Queue
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pipes-version"))
+from filter import Message
+from ring import RingQueue
+
+NUM_MESSAGES = 50000
+RING_CAPACITY = 64 * 1024
+CONTENT_SIZES = [16, 256, 4096]
+
+def producer(channel, content: str, count: int):
+    created_at = datetime.now()
+    for i in range(count):
+        channel.put(Message(id=i, content=content, created_at=created_at))
+    channel.put(None)
+
+def consumer(channel, results):
+    received = 0
+    expected_id = 0
+    while True:
+        message = channel.get()
+        if message is None:
+            break
+        if message.id != expected_id:
+            raise RuntimeError(f"Out of order: got {message.id}, expected {expected_id}")
+        expected_id += 1
+        received += 1
+    results.put(received)
+
+def run(make_channel, content: str) -> float:
+    channel = make_channel()
+    results = Queue()
+    processes = [
+        Process(target=consumer, args=(channel, results)),
+        Process(target=producer, args=(channel, content, NUM_MESSAGES)),
+    ]
+
+    start_time = time.perf_counter()
+    for process in processes:
+        process.start()
+    received = results.get()
+    elapsed = time.perf_counter() - start_time
+
+    for process in processes:
+        process.join()
+    if isinstance(channel, RingQueue):
+        channel.close()
+    if received != NUM_MESSAGES:
+        raise RuntimeError(f"Received {received} of {NUM_MESSAGES} messages")
+    return NUM_MESSAGES / elapsed
+
+def main():
+    print(f"Producer -> consumer handoff of {NUM_MESSAGES} messages between two processes\n")
+    print(f"{'content bytes':>13} | {'Queue msg/s':>12} | {'RingQueue msg/s':>15}")
+    print("-" * 47)
+    for size in CONTENT_SIZES:
+        content = "x" * size
+        queue_rate = run(Queue, content)
+        ring_rate = run(lambda: RingQueue(RING_CAPACITY), content)
+        print(f"{size:>13} | {queue_rate:>12.0f} | {ring_rate:>15.0f}")
+
+if __name__ == "__main__":
+    main()